@@ -0,0 +1,249 @@
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging_config import set_up_logger
+from scraping import perform_main_search_page_scrapping, perform_item_page_scrapping, perform_card_scrapping
+from driver_pool import DriverPool
+from mongo_manager import MongoManager, BulkWriter
+from seen_index import SeenIndex, filter_unseen
+from frontier import CrawlFrontier
+from url_utils import canonicalize_url
+from exporter import StreamingExporter
+
+logger = set_up_logger(__name__)
+
+
+class Job:
+    def __init__(self, query: str, category: str, pages: int = 10):
+        """
+        One search of a batch
+
+        Args:
+            query: The query to search for
+            category: The category its items are tagged with
+            pages: The maximum number of search pages to scrape, -1 for all of them
+        """
+        if not query or not category:
+            raise ValueError("A job needs a query and a category")
+        self.query = query
+        self.category = category
+        self.pages = pages
+        self.stats = {"found": 0, "skipped": 0, "queued": 0, "scraped": 0, "failed": 0}
+
+    @property
+    def finished(self) -> bool:
+        return self.stats["scraped"] + self.stats["failed"] >= self.stats["queued"]
+
+    def __repr__(self):
+        return f"Job({self.query!r}, {self.category!r}, pages={self.pages})"
+
+
+def load_jobs(path: str):
+    """
+    Read a job file: a CSV with a query, category and optional pages column, or
+    JSON Lines with the same keys.
+    Args:
+        path: The path to the job file.
+    Returns:
+        The list of Job in the order of the file.
+    """
+    with open(path, encoding="utf-8", newline="") as job_file:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(job_file))
+        else:
+            rows = [json.loads(line) for line in job_file if line.strip()]
+
+    jobs = []
+    for line_number, row in enumerate(rows, start=1):
+        try:
+            pages = row.get("pages")
+            jobs.append(Job(row.get("query", "").strip(), row.get("category", "").strip(), int(pages) if pages not in (None, "") else 10))
+        except ValueError as e:
+            raise ValueError(f"Invalid job {line_number} in {path}: {e}") from e
+    logger.info(f"Loaded {len(jobs)} jobs from {path}")
+    return jobs
+
+
+def run_batch(
+        jobs,
+        mongo_manager: MongoManager,
+        *,
+        workers: int = 4,
+        batch_size: int = 100,
+        seen_index: SeenIndex = None,
+        frontier: CrawlFrontier = None,
+        progress_interval: float = 30,
+        incremental: bool = False,
+        fast: bool = False,
+        exporter: StreamingExporter = None,
+        ) -> list:
+    """
+    Run every job over one shared budget of worker threads and browsers.
+
+    The searches of all jobs run first. Their results are then merged by canonical url, so
+    an item found by several queries is fetched once and written with the categories of
+    all of them. Progress of every job is logged as its items complete.
+
+    Args:
+        jobs: The list of Job to run
+        mongo_manager: Where the scraped objects are written
+        workers: Number of searches and item pages fetched concurrently across all jobs
+        batch_size: Documents per bulk upsert
+        seen_index: Items in it are skipped, defaults to an empty index that only dedupes this batch
+        frontier: Records the state of every url so an interrupted batch resumes where it stopped
+        progress_interval: Seconds between progress reports of the unfinished jobs
+        incremental: Only rewrite the items that changed and record their price history
+        fast: Build the items from their search result cards, see perform_card_scrapping
+        exporter: Also writes every scraped item to a file, the caller closes it
+
+    Returns:
+        The list of per-job stats dictionaries, in the order of jobs
+    """
+    if seen_index is None:
+        seen_index = SeenIndex(use_bloom_filter=False)
+    driver_pool = DriverPool(max_drivers_per_type=workers)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            entries = _search_jobs(jobs, executor, driver_pool, seen_index, frontier)
+
+            on_flush = None
+            if frontier is not None:
+                on_flush = lambda documents: frontier.mark_done([document['url'] for document in documents])
+
+            logger.info(f"Scraping {len(entries)} distinct items for {len(jobs)} jobs with {workers} workers")
+            with BulkWriter(mongo_manager, batch_size=batch_size, on_flush=on_flush, incremental=incremental) as bulk_writer:
+                futures = {}
+                for url, entry in entries.items():
+                    if fast:
+                        future = executor.submit(perform_card_scrapping, entry["result"], entry["jobs"][0].category, driver_pool=driver_pool)
+                    else:
+                        future = executor.submit(perform_item_page_scrapping, url, entry["jobs"][0].category, driver_pool=driver_pool)
+                    futures[future] = url
+                reported_at = time.monotonic()
+                for future in as_completed(futures):
+                    url = futures[future]
+                    entry = entries[url]
+                    try:
+                        item = future.result()
+                    except Exception as e:
+                        logger.error("Failed to scrape item %s: %s", url, e)
+                        if frontier is not None:
+                            frontier.mark_failed(url, str(e))
+                        _record(entry["jobs"], "failed")
+                    else:
+                        item.categories = sorted({job.category for job in entry["jobs"]})
+                        document = item.to_dict()
+                        if exporter is not None:
+                            exporter.add(document)
+                        bulk_writer.add(document)
+                        _record(entry["jobs"], "scraped")
+
+                    if time.monotonic() - reported_at >= progress_interval:
+                        reported_at = time.monotonic()
+                        _report_progress(jobs)
+    finally:
+        driver_pool.close()
+
+    logger.info(f"Batch of {len(jobs)} jobs finished: {sum(job.finished for job in jobs)} completed")
+    return [{"query": job.query, "category": job.category, **job.stats} for job in jobs]
+
+
+def search_jobs(jobs, executor, driver_pool: DriverPool, seen_index: SeenIndex) -> dict:
+    """
+    Run the searches of the jobs concurrently and keep the results left to scrape.
+
+    Results are deduped across jobs before the seen index is consulted, so an item shared
+    by two queries is not dropped as already seen by the second one. The found and skipped
+    stats of every job are updated.
+
+    Args:
+        jobs: The list of Job to search
+        executor: The executor the searches run in, one search page at a time per job
+        driver_pool: The pool the searches borrow their browsers from
+        seen_index: Items in it are skipped
+
+    Returns:
+        A dictionary of Job to the list of its unseen results, with canonical urls. Jobs
+        whose search failed are left out
+    """
+    pending_searches = {
+        executor.submit(perform_main_search_page_scrapping, job.query, max_pages=job.pages, driver_pool=driver_pool, search_workers=1): job
+        for job in jobs
+    }
+    searched = {}
+    for future in as_completed(pending_searches):
+        job = pending_searches[future]
+        try:
+            results = future.result()
+        except Exception as e:
+            logger.error(f"Search of job {job!r} failed: {e}")
+            continue
+        job.stats["found"] = len(results)
+        searched[job] = [{**result, "url": canonicalize_url(result['url'])} for result in results]
+
+    by_url = {}
+    for results in searched.values():
+        for result in results:
+            by_url.setdefault(result['url'], result)
+    unseen = {result['url'] for result in filter_unseen(list(by_url.values()), seen_index)}
+
+    kept_by_job = {}
+    for job, results in searched.items():
+        kept_by_job[job] = list({result['url']: result for result in results if result['url'] in unseen}.values())
+        job.stats["skipped"] = len({result['url'] for result in results}) - len(kept_by_job[job])
+    return kept_by_job
+
+
+def _search_jobs(jobs, executor, driver_pool, seen_index, frontier):
+    # canonical url -> {"result": its search result, "jobs": jobs that found it}, in discovery order
+    entries = {}
+
+    to_search = []
+    for job in jobs:
+        if frontier is not None:
+            frontier.recover(job.query, job.category)
+            if frontier.is_search_complete(job.query, job.category, job.pages):
+                logger.info(f"Search of job {job!r} already completed, resuming from the crawl frontier")
+                continue
+            frontier.start_search(job.query, job.category)
+        to_search.append(job)
+
+    kept_by_job = search_jobs(to_search, executor, driver_pool, seen_index)
+    cards = {result['url']: result for kept in kept_by_job.values() for result in kept}
+    for job, kept in kept_by_job.items():
+        if frontier is None:
+            for result in kept:
+                entries.setdefault(result['url'], {"result": result, "jobs": []})["jobs"].append(job)
+        else:
+            frontier.add(kept, job.query, job.category)
+            frontier.complete_search(job.query, job.category, job.pages)
+
+    if frontier is not None:
+        for job in jobs:
+            for result in frontier.claim(job.query, job.category):
+                # Results a previous run left unfinished come without their search card
+                result = cards.get(result['url'], result)
+                entries.setdefault(result['url'], {"result": result, "jobs": []})["jobs"].append(job)
+
+    for entry in entries.values():
+        _record(entry["jobs"], "queued")
+    for job in jobs:
+        if not job.stats["queued"]:
+            logger.info(f"Job {job.query!r} ({job.category}) has no items to scrape: {job.stats}")
+    return entries
+
+
+def _record(jobs, stat: str):
+    for job in jobs:
+        job.stats[stat] += 1
+        if stat != "queued" and job.finished:
+            logger.info(f"Job {job.query!r} ({job.category}) finished: {job.stats}")
+
+
+def _report_progress(jobs):
+    for index, job in enumerate(jobs, start=1):
+        if not job.finished:
+            done = job.stats["scraped"] + job.stats["failed"]
+            logger.info(f"Job {index}/{len(jobs)} {job.query!r} ({job.category}): {done}/{job.stats['queued']} items, {job.stats['failed']} failed")
@@ -0,0 +1,198 @@
+"""
+Offline benchmark of the scraper stages over the hand-written pages in benchmarks/fixtures.
+They exercise every stage but are much smaller than real pages, see the note in their manifest.
+
+Run from the repository root:
+    python benchmarks/run_benchmarks.py [--output bench_output.json] [--compare previous.json]
+
+Mongo writes go to mongomock when it is installed, else to --mongo-uri (a local mongod).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_parsers import available_backends
+from scraping import parse_search_page, parse_item_page
+from mongo_manager import MongoManager, BulkWriter
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixtures():
+    with open(os.path.join(FIXTURES_DIR, "manifest.json"), encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+
+    def read(entries):
+        pages = []
+        for entry in entries:
+            with open(os.path.join(FIXTURES_DIR, entry["file"]), encoding="utf-8") as page:
+                pages.append((entry["url"], page.read()))
+        return pages
+
+    return read(manifest["search_pages"]), read(manifest["item_pages"])
+
+
+def percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(samples, units_per_sample=1):
+    """
+    Summarize per-operation latencies.
+    Args:
+        samples: The seconds each operation took.
+        units_per_sample: Items processed by each operation, for the throughput.
+    Returns:
+        A dictionary with the count, throughput and p50/p95 latency in milliseconds.
+    """
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "operations": len(ordered),
+        "throughput_per_second": (len(ordered) * units_per_sample) / total if total else None,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+    }
+
+
+def time_operation(operation, iterations):
+    samples = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - started_at)
+    return samples
+
+
+def bench_parsing(search_pages, item_pages, backend, iterations):
+    results = {}
+
+    search_samples = []
+    items_per_page = []
+    for _, html in search_pages:
+        items_per_page.append(len(parse_search_page(html, backend)[0]))
+        search_samples += time_operation(lambda: parse_search_page(html, backend), iterations)
+    results["search_parse"] = summarize(search_samples, sum(items_per_page) / len(items_per_page))
+
+    item_samples = []
+    auto_samples = []
+    objects = []
+    for url, html in item_pages:
+        objects.append(parse_item_page(html, url, "benchmark", backend, "dom"))
+        item_samples += time_operation(lambda: parse_item_page(html, url, "benchmark", backend, "dom"), iterations)
+        auto_samples += time_operation(lambda: parse_item_page(html, url, "benchmark", backend, "auto"), iterations)
+    results["item_extract"] = summarize(item_samples)
+    results["item_extract_json_state"] = summarize(auto_samples)
+
+    to_dict_samples = []
+    for item in objects:
+        to_dict_samples += time_operation(item.to_dict, iterations)
+    results["to_dict"] = summarize(to_dict_samples)
+
+    return results, objects
+
+
+def build_mongo_manager(mongo_uri):
+    try:
+        import mongomock
+        return MongoManager(client=mongomock.MongoClient(), database_name="benchmark")
+    except ImportError:
+        if not mongo_uri:
+            return None
+        return MongoManager(connection_string=mongo_uri, database_name="benchmark")
+
+
+def bench_mongo(mongo_manager, objects, documents, batch_size):
+    collection = "BenchmarkItems"
+    mongo_manager.db[collection].drop()
+
+    template = [item.to_dict() for item in objects]
+    batches = []
+    for start in range(0, documents, batch_size):
+        batch = []
+        for n in range(start, min(start + batch_size, documents)):
+            document = dict(template[n % len(template)])
+            document["item_id"] = f"MCO-{n:010d}"  # Distinct keys, so every write is an upsert
+            batch.append(document)
+        batches.append(batch)
+
+    samples = []
+    writer = BulkWriter(mongo_manager, collection_name=collection, batch_size=batch_size, flush_interval=0)
+    for batch in batches:
+        started_at = time.perf_counter()
+        for document in batch:
+            writer.add(document)
+        writer.flush()
+        samples.append(time.perf_counter() - started_at)
+    writer.close()
+    mongo_manager.db[collection].drop()
+
+    return summarize(samples, batch_size)
+
+
+def compare(report, baseline_path, tolerance):
+    """Return the stages whose p50 got slower than the baseline by more than tolerance"""
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = []
+    for backend, stages in report["backends"].items():
+        for stage, numbers in stages.items():
+            previous = baseline.get("backends", {}).get(backend, {}).get(stage)
+            if previous and numbers["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+                regressions.append(f"{backend}/{stage}: p50 {previous['p50_ms']:.3f} ms -> {numbers['p50_ms']:.3f} ms")
+    if "mongo_write" in report and "mongo_write" in baseline:
+        if report["mongo_write"]["p50_ms"] > baseline["mongo_write"]["p50_ms"] * (1 + tolerance):
+            regressions.append(f"mongo_write: p50 {baseline['mongo_write']['p50_ms']:.3f} ms -> {report['mongo_write']['p50_ms']:.3f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper stages on saved pages")
+    parser.add_argument("--iterations", type=int, default=50, help="Times each page is processed per stage")
+    parser.add_argument("--backends", nargs="*", default=None, help="Parser backends to run (default: all available)")
+    parser.add_argument("--documents", type=int, default=5000, help="Documents written in the Mongo stage")
+    parser.add_argument("--batch-size", type=int, default=500, help="BulkWriter batch size in the Mongo stage")
+    parser.add_argument("--mongo-uri", default=os.getenv("BENCHMARK_MONGO_URI"), help="Local mongod used when mongomock is not installed")
+    parser.add_argument("--output", default="bench_output.json", help="Where the JSON report is written")
+    parser.add_argument("--compare", help="A previous report; exit with status 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="Allowed p50 slowdown against --compare (default: 0.20)")
+    args = parser.parse_args()
+
+    search_pages, item_pages = load_fixtures()
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "iterations": args.iterations,
+        "backends": {},
+    }
+
+    objects = None
+    for backend in args.backends or available_backends():
+        report["backends"][backend], objects = bench_parsing(search_pages, item_pages, backend, args.iterations)
+
+    mongo_manager = build_mongo_manager(args.mongo_uri)
+    if mongo_manager is None:
+        print("Skipping Mongo stage: install mongomock or pass --mongo-uri")
+    else:
+        report["mongo_write"] = bench_mongo(mongo_manager, objects, args.documents, args.batch_size)
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.compare:
+        regressions = compare(report, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging_config import set_up_logger
+from scraping import perform_item_page_scrapping, perform_card_scrapping
+from driver_pool import DriverPool
+from mongo_manager import MongoManager, BulkWriter
+from seen_index import SeenIndex
+from task_queue import MongoTaskQueue
+from batch_runner import search_jobs
+
+logger = set_up_logger(__name__)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def run_coordinator(jobs, task_queue: MongoTaskQueue, *, workers: int = 4, seen_index: SeenIndex = None) -> dict:
+    """
+    Run the search stage of the jobs and queue their items for the workers.
+    Args:
+        jobs: The list of Job to search.
+        task_queue: The queue shared with the workers.
+        workers: Number of searches run concurrently.
+        seen_index: Items in it are not queued, defaults to an empty index that only dedupes this call.
+    Returns:
+        A dictionary of the number of new tasks per (query, category).
+    """
+    if seen_index is None:
+        seen_index = SeenIndex(use_bloom_filter=False)
+    task_queue.ensure_indexes()
+
+    driver_pool = DriverPool(max_drivers_per_type=workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            kept_by_job = search_jobs(jobs, executor, driver_pool, seen_index)
+    finally:
+        driver_pool.close()
+
+    queued = {}
+    for job, kept in kept_by_job.items():
+        queued[(job.query, job.category)] = task_queue.enqueue(kept, job.category)
+        logger.info(f"Job {job.query!r} ({job.category}): {job.stats['found']} found, {job.stats['skipped']} skipped, {len(kept)} queued")
+    logger.info(f"Coordinator finished, queue: {task_queue.counts()}")
+    return queued
+
+
+def run_worker(
+        mongo_manager: MongoManager,
+        task_queue: MongoTaskQueue,
+        *,
+        worker_id: str = None,
+        threads: int = 4,
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        idle_timeout: float = 60,
+        poll_interval: float = 2,
+        incremental: bool = False,
+        fast: bool = False,
+        ) -> dict:
+    """
+    Lease item tasks from the shared queue, scrape them and write them through MongoManager.
+
+    Any number of workers can run on any number of nodes. A task is marked done once its
+    document is written; if the worker dies first the lease expires and another worker
+    takes it. The worker stops once it found nothing to lease for idle_timeout seconds.
+
+    Args:
+        mongo_manager: Where the scraped objects are written
+        task_queue: The queue filled by the coordinator
+        worker_id: Identifies the worker in its leases, defaults to hostname-pid
+        threads: Number of tasks scraped concurrently by this worker
+        batch_size: Documents per bulk upsert
+        flush_interval: Maximum seconds a scraped document waits before being written,
+            keep it well under the lease duration
+        idle_timeout: Seconds without work after which the worker stops, None to run forever
+        poll_interval: Seconds between lease attempts while the queue is empty
+        incremental: Only rewrite the items that changed and record their price history
+        fast: Build the items from their search result cards, see perform_card_scrapping
+
+    Returns:
+        Dictionary with the scraped and failed counts and the writer's flush stats
+    """
+    worker_id = worker_id or default_worker_id()
+    driver_pool = DriverPool(max_drivers_per_type=threads)
+    stats = {"scraped": 0, "failed": 0}
+    stats_lock = threading.Lock()
+    on_flush = lambda documents: task_queue.complete([document['url'] for document in documents], worker_id)
+    bulk_writer = BulkWriter(mongo_manager, batch_size=batch_size, flush_interval=flush_interval, on_flush=on_flush, incremental=incremental)
+
+    def work():
+        idle_since = time.monotonic()
+        while True:
+            task = task_queue.lease(worker_id)
+            if task is None:
+                if idle_timeout is not None and time.monotonic() - idle_since >= idle_timeout:
+                    return
+                time.sleep(poll_interval)
+                continue
+            idle_since = time.monotonic()
+
+            categories = sorted(task.get("categories") or [])
+            try:
+                if fast:
+                    item = perform_card_scrapping(task["result"], categories[0], driver_pool=driver_pool)
+                else:
+                    item = perform_item_page_scrapping(task["url"], categories[0], driver_pool=driver_pool)
+            except Exception as e:
+                logger.error("Failed to scrape item %s: %s", task["url"], e)
+                task_queue.fail(task, worker_id, str(e))
+                with stats_lock:
+                    stats["failed"] += 1
+                continue
+
+            item.categories = categories
+            bulk_writer.add(item.to_dict())
+            with stats_lock:
+                stats["scraped"] += 1
+
+    logger.info(f"Worker {worker_id} started with {threads} threads")
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for future in [executor.submit(work) for _ in range(threads)]:
+                future.result()
+    finally:
+        bulk_writer.close()
+        driver_pool.close()
+
+    stats["writer"] = bulk_writer.stats
+    logger.info(f"Worker {worker_id} finished: {stats}")
+    return stats
@@ -0,0 +1,311 @@
+import atexit
+import threading
+from contextlib import contextmanager
+from enum import Enum
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import WebDriverException, TimeoutException
+from logging_config import set_up_logger
+from metrics import metrics_registry
+
+logger = set_up_logger(__name__)
+
+class WebDriverType(Enum):
+    CHROME = 'chrome'
+    EDGE = 'edge'
+    FIREFOX = 'firefox'
+    SAFARI = 'safari'
+    INTERNET_EXPLORER = 'internet explorer'
+
+
+# URL patterns of each blockable resource type, in Network.setBlockedURLs syntax
+RESOURCE_TYPE_URL_PATTERNS = {
+    'image': ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.svg', '*.ico', '*.avif'],
+    'font': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'],
+    'media': ['*.mp4', '*.webm', '*.mp3', '*.m3u8'],
+    'stylesheet': ['*.css'],
+}
+TRACKER_URL_PATTERNS = [
+    '*google-analytics.com*',
+    '*googletagmanager.com*',
+    '*doubleclick.net*',
+    '*googlesyndication.com*',
+    '*facebook.net*',
+    '*hotjar.com*',
+    '*clarity.ms*',
+    '*mercadolibre.com/tracks*',
+    '*mercadolibre.com*/melidata*',
+]
+
+
+class DriverProfile:
+    def __init__(self, name: str, *, headless: bool = True, page_load_strategy: str = 'eager', blocked_resource_types=('image', 'font', 'media'), blocked_url_patterns=tuple(TRACKER_URL_PATTERNS), disable_image_cache: bool = True):
+        """
+        Launch options of a browser, tuned to what a stage needs to read
+
+        Args:
+            name: Identifies the profile in the driver pool
+            headless: Run the browser without a window
+            page_load_strategy: 'normal', 'eager' (stop at DOMContentLoaded) or 'none'
+            blocked_resource_types: Keys of RESOURCE_TYPE_URL_PATTERNS never downloaded
+            blocked_url_patterns: Extra URL patterns never downloaded, e.g. ads and analytics
+            disable_image_cache: Do not keep images in the browser cache
+        """
+        unknown = set(blocked_resource_types) - set(RESOURCE_TYPE_URL_PATTERNS)
+        if unknown:
+            raise ValueError(f"Unknown resource types: {unknown}")
+        self.name = name
+        self.headless = headless
+        self.page_load_strategy = page_load_strategy
+        self.blocked_resource_types = tuple(blocked_resource_types)
+        self.blocked_url_patterns = tuple(blocked_url_patterns)
+        self.disable_image_cache = disable_image_cache
+
+    @property
+    def blocked_urls(self):
+        patterns = [pattern for resource_type in self.blocked_resource_types for pattern in RESOURCE_TYPE_URL_PATTERNS[resource_type]]
+        return patterns + list(self.blocked_url_patterns)
+
+
+# Launch options of the original scraper: a visible browser downloading everything
+DEFAULT_PROFILE = DriverProfile('default', headless=False, page_load_strategy='normal', blocked_resource_types=(), blocked_url_patterns=(), disable_image_cache=False)
+# The search page is read once the result list is in the DOM, CSS is not needed
+SEARCH_PROFILE = DriverProfile('search', blocked_resource_types=('image', 'font', 'media', 'stylesheet'))
+# The item page lays out its gallery with CSS, but the image url is read from the src attribute
+ITEM_PROFILE = DriverProfile('item', blocked_resource_types=('image', 'font', 'media'))
+
+
+def _build_options(web_driver_type: WebDriverType, profile: DriverProfile):
+    if web_driver_type in (WebDriverType.CHROME, WebDriverType.EDGE):
+        options = webdriver.ChromeOptions() if web_driver_type == WebDriverType.CHROME else webdriver.EdgeOptions()
+        if profile.headless:
+            options.add_argument('--headless=new')
+        if 'image' in profile.blocked_resource_types:
+            options.add_argument('--blink-settings=imagesEnabled=false')
+            options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+        if profile.disable_image_cache:
+            options.add_argument('--disk-cache-size=1')
+            options.add_argument('--media-cache-size=1')
+    elif web_driver_type == WebDriverType.FIREFOX:
+        options = webdriver.FirefoxOptions()
+        if profile.headless:
+            options.add_argument('-headless')
+        if 'image' in profile.blocked_resource_types:
+            options.set_preference('permissions.default.image', 2)
+        if 'font' in profile.blocked_resource_types:
+            options.set_preference('gfx.downloadable_fonts.enabled', False)
+        if profile.disable_image_cache:
+            options.set_preference('browser.cache.disk.enable', False)
+            options.set_preference('browser.cache.memory.enable', False)
+    elif web_driver_type == WebDriverType.SAFARI:
+        options = webdriver.SafariOptions()
+    elif web_driver_type == WebDriverType.INTERNET_EXPLORER:
+        options = webdriver.IeOptions()
+    else:
+        raise ValueError(f"Web driver type {web_driver_type} not supported")
+
+    options.page_load_strategy = profile.page_load_strategy
+    return options
+
+
+def create_driver(driver_path='/usr/bin/chromedriver', web_driver_type=WebDriverType.CHROME, profile: DriverProfile = DEFAULT_PROFILE):
+    """
+    Launch a new web driver of the given type.
+    Args:
+        driver_path: The path to the driver.
+        web_driver_type: The type of web driver to use.
+        profile: The launch options of the browser.
+    Returns:
+        A new selenium web driver.
+    """
+    service = Service(driver_path)
+    options = _build_options(web_driver_type, profile)
+    if web_driver_type == WebDriverType.CHROME:
+        driver = webdriver.Chrome(service=service, options=options)
+    elif web_driver_type == WebDriverType.EDGE:
+        driver = webdriver.Edge(service=service, options=options)
+    elif web_driver_type == WebDriverType.FIREFOX:
+        driver = webdriver.Firefox(service=service, options=options)
+    elif web_driver_type == WebDriverType.SAFARI:
+        driver = webdriver.Safari(service=service, options=options)
+    elif web_driver_type == WebDriverType.INTERNET_EXPLORER:
+        driver = webdriver.Ie(service=service, options=options)
+    else:
+        raise ValueError(f"Web driver type {web_driver_type} not supported")
+
+    blocked_urls = profile.blocked_urls
+    if blocked_urls:
+        if web_driver_type in (WebDriverType.CHROME, WebDriverType.EDGE):
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_urls})
+        else:
+            logger.warning(f"URL blocking is not supported on {web_driver_type.value}, profile {profile.name} only partially applied")
+    return driver
+
+
+class _PooledDriver:
+    def __init__(self, driver, key):
+        self.driver = driver
+        self.key = key  # (WebDriverType, DriverProfile)
+        self.pages_served = 0
+
+
+class DriverPool:
+    def __init__(self, *, driver_path: str = '/usr/bin/chromedriver', max_drivers_per_type: int = 1, max_pages_per_driver: int = 50):
+        """
+        Pool of long-lived web drivers, so a browser is not cold started for every page.
+
+        Args:
+            driver_path: The path to the driver used when launching new browsers
+            max_drivers_per_type: Maximum number of live drivers for each WebDriverType and profile
+            max_pages_per_driver: Number of checkouts after which a driver is recycled
+        """
+        if max_drivers_per_type < 1:
+            raise ValueError("max_drivers_per_type must be at least 1")
+        if max_pages_per_driver < 1:
+            raise ValueError("max_pages_per_driver must be at least 1")
+
+        self.driver_path = driver_path
+        self.max_drivers_per_type = max_drivers_per_type
+        self.max_pages_per_driver = max_pages_per_driver
+
+        self._lock = threading.Condition()  # Shared by every key, so waking a waiter means waking them all
+        self._idle = {}  # (WebDriverType, DriverProfile) -> list of idle _PooledDriver
+        self._live_count = {}  # (WebDriverType, DriverProfile) -> number of drivers created and not yet discarded
+        self._closed = False
+
+    @contextmanager
+    def checkout(self, web_driver_type: WebDriverType = WebDriverType.CHROME, profile: DriverProfile = DEFAULT_PROFILE):
+        """
+        Borrow a driver launched with the given profile, blocking until one is available.
+
+        The driver is returned to the pool on exit. If the body raises a
+        WebDriverException other than a timeout the browser is assumed to
+        have crashed and is discarded instead.
+        """
+        pooled = self._acquire((web_driver_type, profile))
+        try:
+            yield pooled.driver
+        except TimeoutException:
+            self._release(pooled)
+            raise
+        except WebDriverException:
+            logger.warning(f"Discarding {web_driver_type.value} driver after a web driver error")
+            metrics_registry.increment("driver_crashes", browser=web_driver_type.value)
+            self._discard(pooled)
+            raise
+        except BaseException:
+            self._release(pooled)
+            raise
+        else:
+            self._release(pooled)
+
+    def _acquire(self, key) -> _PooledDriver:
+        web_driver_type, profile = key
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Driver pool is closed")
+
+                idle = self._idle.setdefault(key, [])
+                live = self._live_count.get(key, 0)
+                if idle:
+                    pooled = idle.pop()
+                elif live < self.max_drivers_per_type:
+                    self._live_count[key] = live + 1
+                    pooled = None
+                else:
+                    self._lock.wait()
+                    continue
+
+            if pooled is None:
+                try:
+                    logger.info(f"Launching new {web_driver_type.value} driver with profile {profile.name}")
+                    with metrics_registry.timer("driver_startup", browser=web_driver_type.value):
+                        driver = create_driver(self.driver_path, web_driver_type, profile)
+                except BaseException:
+                    with self._lock:
+                        self._live_count[key] -= 1
+                        self._lock.notify_all()
+                    raise
+                pooled = _PooledDriver(driver, key)
+            elif not self._is_healthy(pooled):
+                logger.warning(f"Idle {web_driver_type.value} driver failed health check, replacing it")
+                self._discard(pooled)
+                continue
+
+            pooled.pages_served += 1
+            return pooled
+
+    def _release(self, pooled: _PooledDriver):
+        if pooled.pages_served >= self.max_pages_per_driver:
+            logger.info(f"Recycling {pooled.key[0].value} driver after {pooled.pages_served} pages")
+            self._discard(pooled)
+            return
+
+        with self._lock:
+            if self._closed:
+                pooled_to_quit = pooled
+            else:
+                self._idle.setdefault(pooled.key, []).append(pooled)
+                self._lock.notify_all()
+                return
+        self._quit(pooled_to_quit)
+
+    def _discard(self, pooled: _PooledDriver):
+        with self._lock:
+            self._live_count[pooled.key] -= 1
+            self._lock.notify_all()
+        self._quit(pooled)
+
+    @staticmethod
+    def _is_healthy(pooled: _PooledDriver) -> bool:
+        try:
+            pooled.driver.current_url  # Any round trip to the browser will do
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(pooled: _PooledDriver):
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            logger.warning(f"Error while closing driver: {e}")
+
+    def close(self):
+        """Quit every idle driver. Drivers still checked out are quit when they are returned."""
+        with self._lock:
+            self._closed = True
+            to_quit = [pooled for idle in self._idle.values() for pooled in idle]
+            self._idle.clear()
+            self._lock.notify_all()
+
+        for pooled in to_quit:
+            self._quit(pooled)
+        logger.info(f"Driver pool closed, {len(to_quit)} drivers quit")
+
+
+_default_pools = {}
+_default_pools_lock = threading.Lock()
+
+def get_default_pool(driver_path: str = '/usr/bin/chromedriver') -> DriverPool:
+    """
+    Get the process wide driver pool for the given driver path, creating it on first use.
+    Args:
+        driver_path: The path to the driver.
+    Returns:
+        The shared DriverPool.
+    """
+    with _default_pools_lock:
+        pool = _default_pools.get(driver_path)
+        if pool is None:
+            pool = DriverPool(driver_path=driver_path)
+            _default_pools[driver_path] = pool
+        return pool
+
+
+@atexit.register
+def _close_default_pools():
+    for pool in _default_pools.values():
+        pool.close()
@@ -0,0 +1,176 @@
+import csv
+import os
+import threading
+from logging_config import set_up_logger
+from mercado_libre import Mercado_Libre_Object
+
+logger = set_up_logger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_FIELDS = ["item_id", "title", "url", "price", "currency", "condition", "seller_name", "first_image_url", "category", "categories"]
+CATEGORIES_SEPARATOR = "|"
+
+
+class StreamingExporter:
+    def __init__(self, path: str, *, batch_size: int = 10_000):
+        """
+        Write scraped items to a file while the crawl runs, batch_size rows at a time
+
+        Only the current batch is kept in memory, so exporting millions of items takes
+        as much memory as exporting batch_size of them.
+
+        Args:
+            path: The file to write, replaced if it exists
+            batch_size: Rows buffered before they are written as one group
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._columns = {field: [] for field in EXPORT_FIELDS}
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    def add(self, item):
+        """Buffer an item, a Mercado_Libre_Object or its to_dict(), writing the batch when full"""
+        document = item.to_dict() if isinstance(item, Mercado_Libre_Object) else item
+        with self._lock:
+            for field, column in self._columns.items():
+                column.append(document.get(field))
+            self._buffered += 1
+            if self._buffered >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        columns, self._columns = self._columns, {field: [] for field in EXPORT_FIELDS}
+        self._write_batch(columns, self._buffered)
+        self.rows_written += self._buffered
+        self._buffered = 0
+
+    def _write_batch(self, columns: dict, row_count: int):
+        raise NotImplementedError
+
+    def close(self):
+        """Write what is left and close the file"""
+        with self._lock:
+            self._flush()
+            self._close_file()
+        logger.info(f"Exported {self.rows_written} items to {self.path}")
+
+    def _close_file(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvExporter(StreamingExporter):
+    """CSV with a header row, the categories joined by CATEGORIES_SEPARATOR"""
+
+    def __init__(self, path: str, *, batch_size: int = 10_000):
+        super().__init__(path, batch_size=batch_size)
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(EXPORT_FIELDS)
+
+    def _write_batch(self, columns: dict, row_count: int):
+        columns["categories"] = [CATEGORIES_SEPARATOR.join(categories or ()) for categories in columns["categories"]]
+        self._writer.writerows(zip(*(columns[field] for field in EXPORT_FIELDS)))
+        self._file.flush()
+
+    def _close_file(self):
+        self._file.close()
+
+
+def _arrow_schema():
+    return pa.schema([
+        ("item_id", pa.string()),
+        ("title", pa.string()),
+        ("url", pa.string()),
+        ("price", pa.float64()),
+        ("currency", pa.dictionary(pa.int32(), pa.string())),
+        ("condition", pa.dictionary(pa.int32(), pa.string())),
+        ("seller_name", pa.string()),
+        ("first_image_url", pa.string()),
+        ("category", pa.dictionary(pa.int32(), pa.string())),
+        ("categories", pa.list_(pa.string())),
+    ])
+
+
+def _to_arrow_table(columns: dict, schema):
+    columns["categories"] = [list(categories) if categories else [] for categories in columns["categories"]]
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+class ParquetExporter(StreamingExporter):
+    """Parquet with one row group per batch, the repeated strings dictionary encoded"""
+
+    def __init__(self, path: str, *, batch_size: int = 10_000):
+        if pa is None:
+            raise ImportError("Parquet export needs pyarrow, install it or export to a .csv file")
+        super().__init__(path, batch_size=batch_size)
+        self.schema = _arrow_schema()
+        self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def _write_batch(self, columns: dict, row_count: int):
+        self._writer.write_table(_to_arrow_table(columns, self.schema), row_group_size=row_count)
+
+    def _close_file(self):
+        self._writer.close()
+
+
+class ArrowExporter(StreamingExporter):
+    """Arrow IPC file with one record batch per batch, readable with memory mapping"""
+
+    def __init__(self, path: str, *, batch_size: int = 10_000):
+        if pa is None:
+            raise ImportError("Arrow export needs pyarrow, install it or export to a .csv file")
+        super().__init__(path, batch_size=batch_size)
+        self.schema = _arrow_schema()
+        self._sink = pa.OSFile(path, "wb")
+        self._writer = pa.ipc.new_file(self._sink, self.schema)
+
+    def _write_batch(self, columns: dict, row_count: int):
+        self._writer.write_table(_to_arrow_table(columns, self.schema))
+
+    def _close_file(self):
+        self._writer.close()
+        self._sink.close()
+
+
+def open_exporter(path: str, batch_size: int = 10_000) -> StreamingExporter:
+    """
+    Build the exporter matching the extension of path.
+    Args:
+        path: A .csv, .parquet or .arrow file.
+        batch_size: Rows buffered before they are written as one group.
+    Returns:
+        A CsvExporter, ParquetExporter or ArrowExporter.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return CsvExporter(path, batch_size=batch_size)
+    if extension in (".parquet", ".pq"):
+        return ParquetExporter(path, batch_size=batch_size)
+    if extension in (".arrow", ".feather"):
+        return ArrowExporter(path, batch_size=batch_size)
+    raise ValueError(f"Export format {extension} not supported, use .csv, .parquet or .arrow")
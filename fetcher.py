@@ -0,0 +1,370 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from logging_config import set_up_logger
+from driver_pool import DriverPool, DriverProfile, WebDriverType, DEFAULT_PROFILE, get_default_pool
+from page_cache import PageCache
+from metrics import metrics_registry
+from rate_limiter import AdaptiveRateLimiter, get_default_rate_limiter
+
+logger = set_up_logger(__name__)
+
+try:  # requests only decodes brotli responses when one of these is installed
+    import brotli  # noqa: F401
+    _ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        _ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        _ACCEPT_ENCODING = "gzip, deflate"
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "es-CO,es;q=0.9,en;q=0.8",
+    "Accept-Encoding": _ACCEPT_ENCODING,
+}
+
+
+# Looked for only when the ready marker is missing, so scripts of normal pages do not trigger them
+CHALLENGE_MARKERS = ('captcha', 'account-verification', 'suspicious-traffic', 'cf-challenge', 'access denied')
+NOT_FOUND_MARKERS = ('página no existe', 'pagina no existe', 'page not found')
+EMPTY_PAGE_BYTES = 512  # Pages this short have no content, e.g. <html><head></head><body></body></html>
+
+
+class FetchError(Exception):
+    """Raised when a page could not be fetched with the requested backend"""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code  # The HTTP status behind the error, None when it was read from the page
+
+
+class BlockedPageError(FetchError):
+    """Raised when the site answers with a challenge or a throttling status instead of the page"""
+
+
+class PageNotFoundError(FetchError):
+    """Raised when the page does not exist, retrying it will not help"""
+
+
+class EmptyPageError(FetchError):
+    """Raised when the site answers with a page without content"""
+
+
+def detect_page_problem(html: str):
+    """
+    Recognize pages that will never show the ready marker.
+    Args:
+        html: The html of a page missing its ready marker.
+    Returns:
+        BlockedPageError, PageNotFoundError or EmptyPageError, or None if the page looks normal.
+    """
+    if len(html.strip()) < EMPTY_PAGE_BYTES:
+        return EmptyPageError
+    return detect_visible_problem(html)
+
+
+def detect_visible_problem(text: str):
+    """
+    Recognize a challenge or a missing page from its text, without the empty page check.
+    Args:
+        text: The html of the page, or only its visible text.
+    Returns:
+        BlockedPageError or PageNotFoundError, or None if no marker is found.
+    """
+    lowered = text.lower()
+    if any(marker in lowered for marker in CHALLENGE_MARKERS):
+        return BlockedPageError
+    if any(marker in lowered for marker in NOT_FOUND_MARKERS):
+        return PageNotFoundError
+    return None
+
+
+class PageFetcher:
+    """Base class of the page fetching backends used by the scrape functions"""
+
+    def fetch(self, url: str, ready_marker: str = None) -> str:
+        """
+        Fetch the html of a page.
+        Args:
+            url: The url of the page.
+            ready_marker: A css class that must be present for the page to be considered complete.
+        Returns:
+            The html of the page.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class HttpFetcher(PageFetcher):
+    def __init__(self, *, pool_size: int = 10, timeout: float = 10, headers: dict = None):
+        """
+        Plain HTTP fetcher over a keep-alive connection pool
+
+        Args:
+            pool_size: Maximum number of kept-alive connections per host
+            timeout: Seconds to wait for the server before giving up
+            headers: Headers sent with every request, defaults to DEFAULT_HEADERS
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, url: str, ready_marker: str = None) -> str:
+        try:
+            with metrics_registry.timer("http_get"):
+                response = self.session.get(url, timeout=self.timeout)
+            if response.status_code in (404, 410):
+                raise PageNotFoundError(f"{url} answered {response.status_code}", response.status_code)
+            if response.status_code in (403, 429, 503):
+                raise BlockedPageError(f"{url} answered {response.status_code}", response.status_code)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            metrics_registry.increment("http_get_failures")
+            raise FetchError(f"HTTP fetch of {url} failed: {e}") from e
+
+        html = response.text
+        if ready_marker and ready_marker not in html:
+            problem = detect_page_problem(html) or FetchError
+            raise problem(f"Marker '{ready_marker}' not found in the HTTP response of {url}")
+        return html
+
+    def close(self):
+        self.session.close()
+
+
+class SeleniumFetcher(PageFetcher):
+    def __init__(self, *, driver_pool: DriverPool = None, web_driver_type: WebDriverType = WebDriverType.CHROME, profile: DriverProfile = DEFAULT_PROFILE, timeout: float = 10):
+        """
+        Fetcher that renders the page in a pooled web driver
+
+        Args:
+            driver_pool: The pool to borrow drivers from, defaults to the shared pool
+            web_driver_type: The type of web driver to use
+            profile: The launch options of the browsers used
+            timeout: Seconds to wait for the ready marker to show up
+        """
+        self.driver_pool = driver_pool or get_default_pool()
+        self.web_driver_type = web_driver_type
+        self.profile = profile
+        self.timeout = timeout
+
+    def fetch(self, url: str, ready_marker: str = None) -> str:
+        with self.driver_pool.checkout(self.web_driver_type, self.profile) as driver:
+            with metrics_registry.timer("driver_get"):
+                driver.get(url)
+            logger.info("Navigated to: %s", url)
+
+            if ready_marker:
+                wait = WebDriverWait(driver, self.timeout)
+                try:
+                    with metrics_registry.timer("page_wait"):
+                        problem = wait.until(self._ready_or_failed(ready_marker))
+                except TimeoutException:
+                    metrics_registry.increment("page_wait_timeouts")
+                    raise
+                if problem is not True:
+                    raise problem(f"Marker '{ready_marker}' not found in the rendered page of {url}")
+
+            # The driver goes back to the pool as soon as we have the source
+            return driver.page_source
+
+    @staticmethod
+    def _ready_or_failed(ready_marker: str):
+        # Stop waiting as soon as the loaded page shows a challenge or a missing page, instead of
+        # running into the timeout. Only the visible text is read: scripts may mention a captcha,
+        # and a JS page can still render its marker, or its content, after the load event.
+        marker_present = EC.presence_of_element_located((By.CLASS_NAME, ready_marker))
+
+        def check(driver):
+            try:
+                if marker_present(driver):
+                    return True
+            except NoSuchElementException:
+                pass  # Raised rather than returned, WebDriverWait would swallow it and skip the checks below
+            if driver.execute_script("return document.readyState") != "complete":
+                return False
+            return detect_visible_problem(driver.execute_script("return document.body ? document.body.innerText : ''") or "") or False
+        return check
+
+
+class FallbackFetcher(PageFetcher):
+    def __init__(self, primary: PageFetcher, fallback: PageFetcher):
+        """
+        Try the primary fetcher first, use the fallback when it fails or the page needs JS
+
+        Args:
+            primary: The cheap fetcher, usually an HttpFetcher
+            fallback: The fetcher able to render the page, usually a SeleniumFetcher
+        """
+        self.primary = primary
+        self.fallback = fallback
+
+    def fetch(self, url: str, ready_marker: str = None) -> str:
+        try:
+            return self.primary.fetch(url, ready_marker)
+        except FetchError as e:
+            # A block or a missing page read from the markup may be a page that only needs JS,
+            # only an HTTP status is sure to give the browser the same answer
+            if isinstance(e, (PageNotFoundError, BlockedPageError)) and e.status_code is not None:
+                raise
+            logger.info("Falling back to %s: %s", type(self.fallback).__name__, e)
+            metrics_registry.increment("fetch_fallbacks", fetcher=type(self.fallback).__name__)
+            return self.fallback.fetch(url, ready_marker)
+
+    def close(self):
+        self.primary.close()
+        self.fallback.close()
+
+
+class RateLimitedFetcher(PageFetcher):
+    def __init__(self, inner: PageFetcher, rate_limiter: AdaptiveRateLimiter = None, *, max_retries: int = 2):
+        """
+        Pace the requests of the inner fetcher per host, slowing down when the site pushes back
+
+        Blocked and empty pages and timeouts are reported to the rate limiter, which backs
+        the host off, and retried up to max_retries times once the backoff is over.
+
+        Args:
+            inner: The fetcher doing the requests
+            rate_limiter: The limiter shared by every fetcher hitting the same hosts, defaults
+                to the process wide one
+            max_retries: Retries of a blocked, empty or timed out page
+        """
+        self.inner = inner
+        self.rate_limiter = rate_limiter or get_default_rate_limiter()
+        self.max_retries = max_retries
+
+    def fetch(self, url: str, ready_marker: str = None) -> str:
+        attempt = 0
+        while True:
+            with self.rate_limiter.slot(url):
+                try:
+                    html = self.inner.fetch(url, ready_marker)
+                except (BlockedPageError, EmptyPageError, TimeoutException) as e:
+                    self.rate_limiter.record_block(url, type(e).__name__)
+                    if attempt >= self.max_retries:
+                        raise
+                    attempt += 1
+                    logger.info("Retrying %s after %s, attempt %s", url, type(e).__name__, attempt)
+                    continue
+            self.rate_limiter.record_success(url)
+            return html
+
+    def close(self):
+        self.inner.close()
+
+
+class CachingFetcher(PageFetcher):
+    def __init__(self, cache: PageCache, inner: PageFetcher = None, *, replay: bool = False):
+        """
+        Serve pages from a PageCache, fetching and caching the misses
+
+        Args:
+            cache: The page cache
+            inner: The fetcher used on cache misses, not needed in replay mode
+            replay: Only read from the cache, ignoring the TTL, and fail on misses
+        """
+        if inner is None and not replay:
+            raise ValueError("An inner fetcher is required unless replaying")
+        self.cache = cache
+        self.inner = inner
+        self.replay = replay
+
+    def fetch(self, url: str, ready_marker: str = None) -> str:
+        html = self.cache.get(url, ignore_ttl=self.replay)
+        if html is not None:
+            metrics_registry.increment("page_cache_hits")
+            return html
+        metrics_registry.increment("page_cache_misses")
+        if self.replay:
+            raise FetchError(f"{url} is not in the page cache")
+
+        html = self.inner.fetch(url, ready_marker)
+        self.cache.put(url, html)
+        return html
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+
+_default_http_fetcher = None
+_default_http_fetcher_lock = threading.Lock()
+_default_http_pool_size = 10
+_default_page_cache = None
+_default_replay = False
+
+
+def configure_default_page_cache(cache_dir: str = None, ttl_seconds: float = 24 * 3600, max_bytes: int = 1024 ** 3, replay: bool = False):
+    """
+    Put a page cache under every fetcher built by get_default_fetcher in this process.
+    It can be used as a process pool initializer so every worker process gets its own.
+    Args:
+        cache_dir: The cache directory, None to disable the cache.
+        ttl_seconds: Age after which a cached page is refetched.
+        max_bytes: Maximum compressed size of the cached pages.
+        replay: Serve every page from the cache and never hit the network.
+    """
+    global _default_page_cache, _default_replay
+    if replay and cache_dir is None:
+        raise ValueError("Replay mode needs a cache directory")
+    _default_page_cache = PageCache(cache_dir, ttl_seconds=ttl_seconds, max_bytes=max_bytes) if cache_dir else None
+    _default_replay = replay
+
+
+def configure_default_http_pool(pool_size: int):
+    """
+    Size the keep-alive connection pool of the HTTP fetcher shared by get_default_fetcher.
+    Connections beyond the pool size are closed after every request instead of reused.
+    Args:
+        pool_size: The number of fetches running at once in this process, e.g. the item
+            workers plus the search workers.
+    """
+    global _default_http_fetcher, _default_http_pool_size
+    if pool_size < 1:
+        raise ValueError("pool_size must be at least 1")
+    with _default_http_fetcher_lock:
+        _default_http_pool_size = pool_size
+        # Fetchers already built keep the previous one, new ones get a pool of the new size
+        _default_http_fetcher = None
+
+
+def get_default_fetcher(driver_path='/usr/bin/chromedriver', web_driver_type=WebDriverType.CHROME, driver_pool: DriverPool = None, driver_profile: DriverProfile = DEFAULT_PROFILE) -> PageFetcher:
+    """
+    Build the default fetcher: the shared HTTP connection pool, falling back to Selenium,
+    paced by the shared rate limiter and under the page cache if one was configured.
+    Args:
+        driver_path: The path to the driver.
+        web_driver_type: The type of web driver to use.
+        driver_pool: The pool to borrow the driver from. Defaults to the shared pool for driver_path.
+        driver_profile: The launch options of the browser used when falling back to Selenium.
+    Returns:
+        A PageFetcher.
+    """
+    global _default_http_fetcher
+    if _default_replay:
+        return CachingFetcher(_default_page_cache, replay=True)
+
+    with _default_http_fetcher_lock:
+        if _default_http_fetcher is None:
+            _default_http_fetcher = HttpFetcher(pool_size=_default_http_pool_size)
+
+    fetcher = RateLimitedFetcher(FallbackFetcher(
+        _default_http_fetcher,
+        SeleniumFetcher(driver_pool=driver_pool or get_default_pool(driver_path), web_driver_type=web_driver_type, profile=driver_profile),
+    ))
+    if _default_page_cache is not None:
+        fetcher = CachingFetcher(_default_page_cache, fetcher)
+    return fetcher
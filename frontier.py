@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import threading
+import time
+from logging_config import set_up_logger
+from seen_index import SeenIndex
+
+logger = set_up_logger(__name__)
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class CrawlFrontier:
+    def __init__(self, path: str = "cache/frontier.sqlite3", *, max_attempts: int = 3):
+        """
+        Durable record of the urls of a crawl and how far each one got
+
+        Every url found by the search of a (query, category) crawl is stored as pending,
+        moves to in_flight when a worker takes it, and ends as done once its document is
+        written or failed with the error. A restarted run recovers the urls left in flight,
+        retries the failed ones that still have attempts left and skips the search while
+        the completed search still has urls to finish.
+
+        Args:
+            path: The SQLite file holding the frontier
+            max_attempts: Number of times an url is tried before it stays failed
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.path = path
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS searches (
+                query TEXT NOT NULL,
+                category TEXT NOT NULL,
+                max_pages INTEGER NOT NULL,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (query, category)
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                query TEXT NOT NULL,
+                category TEXT NOT NULL,
+                key TEXT NOT NULL,
+                url TEXT NOT NULL,
+                title TEXT,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (query, category, key)
+            );
+            CREATE INDEX IF NOT EXISTS urls_state ON urls(query, category, state);
+            CREATE INDEX IF NOT EXISTS urls_url ON urls(url);
+        """)
+        self._connection.commit()
+
+    def recover(self, query: str, category: str) -> int:
+        """
+        Put back in the queue the urls a previous run left in flight, and the failed ones
+        with attempts left.
+        Args:
+            query: The search query of the crawl.
+            category: The category of the crawl.
+        Returns:
+            The number of urls made pending again.
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE urls SET state = ?, updated_at = ? WHERE query = ? AND category = ? AND (state = ? OR (state = ? AND attempts < ?))",
+                (PENDING, time.time(), query, category, IN_FLIGHT, FAILED, self.max_attempts),
+            )
+            self._connection.commit()
+        if cursor.rowcount:
+            logger.info(f"Recovered {cursor.rowcount} unfinished urls of the crawl {query!r} ({category})")
+        return cursor.rowcount
+
+    def is_search_complete(self, query: str, category: str, max_pages: int) -> bool:
+        """
+        Whether a previous run already crawled at least max_pages search pages (-1 for all)
+        of the query and left urls to finish. Once every url is done or out of attempts the
+        crawl is over, and the next run searches again.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT max_pages FROM searches WHERE query = ? AND category = ?", (query, category)).fetchone()
+            if row is None:
+                return False
+            open_url = self._connection.execute(
+                "SELECT 1 FROM urls WHERE query = ? AND category = ? AND (state IN (?, ?) OR (state = ? AND attempts < ?)) LIMIT 1",
+                (query, category, PENDING, IN_FLIGHT, FAILED, self.max_attempts),
+            ).fetchone()
+        if open_url is None:
+            return False
+        crawled_pages = row[0]
+        return crawled_pages == -1 or (max_pages != -1 and crawled_pages >= max_pages)
+
+    def start_search(self, query: str, category: str):
+        """Forget the completed search of the crawl, so a run interrupted while searching again does not resume a partial search"""
+        with self._lock:
+            self._connection.execute("DELETE FROM searches WHERE query = ? AND category = ?", (query, category))
+            self._connection.commit()
+
+    def complete_search(self, query: str, category: str, max_pages: int):
+        """Record that every search page of the crawl was added, so a restart does not paginate again"""
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO searches (query, category, max_pages, completed_at) VALUES (?, ?, ?, ?)",
+                (query, category, max_pages, time.time()),
+            )
+            self._connection.commit()
+
+    def add(self, results, query: str, category: str) -> int:
+        """
+        Add search results as pending. Urls a previous crawl finished or gave up on are
+        made pending again with fresh attempts, the seen index already dropped the fresh ones.
+        Args:
+            results: The list of dictionaries with the title and url of the items.
+            query: The search query of the crawl.
+            category: The category of the crawl.
+        Returns:
+            The number of urls made pending.
+        """
+        now = time.time()
+        rows = [(query, category, SeenIndex.key_for(result['url']), result['url'], result.get('title'), PENDING, now) for result in results]
+        with self._lock:
+            before = self._connection.total_changes
+            self._connection.executemany(
+                "INSERT INTO urls (query, category, key, url, title, state, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (query, category, key) DO UPDATE SET url = excluded.url, title = excluded.title, state = excluded.state, "
+                "attempts = 0, last_error = NULL, updated_at = excluded.updated_at WHERE urls.state IN (?, ?)",
+                [row + (DONE, FAILED) for row in rows],
+            )
+            self._connection.commit()
+            return self._connection.total_changes - before
+
+    def claim(self, query: str, category: str, limit: int = None):
+        """
+        Take pending urls of the crawl, marking them in flight.
+        Args:
+            query: The search query of the crawl.
+            category: The category of the crawl.
+            limit: Maximum number of urls to take, None for all of them.
+        Returns:
+            The list of dictionaries with the title and url of the items.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, url, title FROM urls WHERE query = ? AND category = ? AND state = ? ORDER BY updated_at LIMIT ?",
+                (query, category, PENDING, -1 if limit is None else limit),
+            ).fetchall()
+            self._connection.executemany(
+                "UPDATE urls SET state = ?, attempts = attempts + 1, updated_at = ? WHERE query = ? AND category = ? AND key = ?",
+                [(IN_FLIGHT, time.time(), query, category, key) for key, _, _ in rows],
+            )
+            self._connection.commit()
+        return [{"title": title, "url": url} for _, url, title in rows]
+
+    def mark_done(self, urls):
+        """Mark urls as done in every crawl they belong to, once their documents are written"""
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "UPDATE urls SET state = ?, last_error = NULL, updated_at = ? WHERE url = ? AND state = ?",
+                [(DONE, now, url, IN_FLIGHT) for url in urls],
+            )
+            self._connection.commit()
+
+    def mark_failed(self, url: str, error: str):
+        """Mark an url as failed, it is retried by the next run while it has attempts left"""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE urls SET state = ?, last_error = ?, updated_at = ? WHERE url = ? AND state = ?",
+                (FAILED, error, time.time(), url, IN_FLIGHT),
+            )
+            self._connection.commit()
+
+    def counts(self, query: str, category: str) -> dict:
+        """Number of urls of the crawl in each state"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT state, COUNT(*) FROM urls WHERE query = ? AND category = ? GROUP BY state", (query, category)
+            ).fetchall()
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
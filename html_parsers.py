@@ -0,0 +1,276 @@
+import os
+import re
+import sys
+import time
+from bs4 import BeautifulSoup, SoupStrainer
+from logging_config import set_up_logger
+
+logger = set_up_logger(__name__)
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+try:
+    import lxml  # noqa: F401
+    _LXML_AVAILABLE = True
+except ImportError:
+    _LXML_AVAILABLE = False
+
+HTML_PARSER = 'html.parser'
+LXML = 'lxml'
+SELECTOLAX = 'selectolax'
+
+# Only the regions we read are parsed, everything else is skipped by the strainer
+SEARCH_PAGE_CLASSES = ['ui-search-layout__item', 'andes-pagination__button--next']
+ITEM_PAGE_CLASSES = [
+    'ui-pdp-title',
+    'andes-money-amount__fraction',
+    'ui-pdp-subtitle',
+    'ui-pdp-seller__header__title',
+    'ui-pdp-gallery__figure__image',
+]
+# What the result cards show, read along the title and url
+CARD_PRICE_SELECTOR = '.poly-price__current .andes-money-amount__fraction'
+CARD_IMAGE_SELECTOR = 'img.poly-component__picture'
+CARD_SELLER_SELECTOR = '.poly-component__seller'
+CARD_CONDITION_SELECTOR = '.poly-component__item-condition'
+GALLERY_IMAGE_CLASS = 'ui-pdp-image ui-pdp-gallery__figure__image'
+_TOTAL_RESULTS_PATTERN = re.compile(r'ui-search-search-result__quantity-results[^>]*>\s*([\d.,]+)')
+
+
+def available_backends():
+    """
+    List the parser backends that can be used in this environment.
+    Returns:
+        The names of the available backends, in order of preference.
+    """
+    backends = []
+    if HTMLParser is not None:
+        backends.append(SELECTOLAX)
+    if _LXML_AVAILABLE:
+        backends.append(LXML)
+    backends.append(HTML_PARSER)
+    return backends
+
+
+def default_backend():
+    """
+    Get the backend set in the HTML_PARSER_BACKEND environment variable, else the first available.
+    Returns:
+        The name of the backend.
+    """
+    backend = os.getenv("HTML_PARSER_BACKEND")
+    if backend:
+        if backend not in available_backends():
+            raise ValueError(f"HTML parser backend {backend} not available")
+        return backend
+    return available_backends()[0]
+
+
+def extract_search_results(html: str, backend: str = None):
+    """
+    Extract the items and the next page link of a search results page.
+    Args:
+        html: The html of the search results page.
+        backend: The parser backend to use, defaults to default_backend().
+    Returns:
+        A tuple with the list of dictionaries with the title and url of the items, plus
+        what their result card shows: price_text, first_image_url, seller_text and
+        condition_text, None when missing. And the url of the next page or None if it
+        is the last one.
+    """
+    backend = backend or default_backend()
+    if backend == SELECTOLAX:
+        return _extract_search_results_selectolax(html)
+    if backend in (LXML, HTML_PARSER):
+        return _extract_search_results_soup(html, backend)
+    raise ValueError(f"HTML parser backend {backend} not supported")
+
+
+def extract_item_fields(html: str, backend: str = None):
+    """
+    Extract the raw fields of an item page.
+    Args:
+        html: The html of the item page.
+        backend: The parser backend to use, defaults to default_backend().
+    Returns:
+        A dictionary with the title, price_text, subtitle_text, seller_name and
+        first_image_url of the item, None for the ones not found.
+    """
+    backend = backend or default_backend()
+    if backend == SELECTOLAX:
+        return _extract_item_fields_selectolax(html)
+    if backend in (LXML, HTML_PARSER):
+        return _extract_item_fields_soup(html, backend)
+    raise ValueError(f"HTML parser backend {backend} not supported")
+
+
+def _card_image_url(src, data_src):
+    # Lazy loaded cards keep an inline placeholder gif in src until they scroll into view
+    if not src or src.startswith('data:'):
+        return data_src or None
+    return src
+
+
+def extract_total_results(html: str):
+    """
+    Read the total result count ("1.253 resultados") of a search results page.
+    Args:
+        html: The html of the search results page.
+    Returns:
+        The number of results, or None if the page does not show it.
+    """
+    match = _TOTAL_RESULTS_PATTERN.search(html)
+    if match is None:
+        return None
+    return int(re.sub(r'[.,]', '', match.group(1)))
+
+
+def _extract_search_results_soup(html, parser):
+    soup = BeautifulSoup(html, parser, parse_only=SoupStrainer(class_=SEARCH_PAGE_CLASSES))
+
+    results = []
+    for item in soup.select('li.ui-search-layout__item'):
+        link = item.select_one('a.poly-component__title')
+        if link:
+            price = item.select_one(CARD_PRICE_SELECTOR)
+            image = item.select_one(CARD_IMAGE_SELECTOR)
+            seller = item.select_one(CARD_SELLER_SELECTOR)
+            condition = item.select_one(CARD_CONDITION_SELECTOR)
+            results.append({
+                "title": link.text.strip(),
+                "url": link.get('href'),
+                "price_text": price.text.strip() if price else None,
+                "first_image_url": _card_image_url(image.get('src'), image.get('data-src')) if image else None,
+                "seller_text": seller.text.strip() if seller else None,
+                "condition_text": condition.text.strip() if condition else None,
+            })
+
+    next_link = soup.select_one('li.andes-pagination__button--next a')
+    next_page_url = next_link.get('href') if next_link else None
+    return results, next_page_url
+
+
+def _extract_search_results_selectolax(html):
+    tree = HTMLParser(html)
+
+    results = []
+    for item in tree.css('li.ui-search-layout__item'):
+        link = item.css_first('a.poly-component__title')
+        if link:
+            price = item.css_first(CARD_PRICE_SELECTOR)
+            image = item.css_first(CARD_IMAGE_SELECTOR)
+            seller = item.css_first(CARD_SELLER_SELECTOR)
+            condition = item.css_first(CARD_CONDITION_SELECTOR)
+            results.append({
+                "title": link.text().strip(),
+                "url": link.attributes.get('href'),
+                "price_text": price.text().strip() if price else None,
+                "first_image_url": _card_image_url(image.attributes.get('src'), image.attributes.get('data-src')) if image else None,
+                "seller_text": seller.text().strip() if seller else None,
+                "condition_text": condition.text().strip() if condition else None,
+            })
+
+    next_link = tree.css_first('li.andes-pagination__button--next a')
+    next_page_url = next_link.attributes.get('href') if next_link else None
+    return results, next_page_url
+
+
+def _extract_item_fields_soup(html, parser):
+    soup = BeautifulSoup(html, parser, parse_only=SoupStrainer(class_=ITEM_PAGE_CLASSES))
+
+    title_elem = soup.find('h1', class_='ui-pdp-title')
+    price_elem = soup.find('span', class_='andes-money-amount__fraction')
+    subtitle_elem = soup.find('span', class_='ui-pdp-subtitle')
+
+    seller_name = None
+    seller_elem = soup.find('div', class_='ui-pdp-seller__header__title')
+    if seller_elem:
+        seller_button = seller_elem.find('button')
+        if seller_button:
+            seller_spans = seller_button.find_all('span')
+            seller_name = seller_spans[1].text.strip() if len(seller_spans) > 1 else None
+
+    first_image_url = None
+    image_elem = soup.find('img', class_=GALLERY_IMAGE_CLASS)
+    if image_elem:
+        first_image_url = image_elem.get('src') or image_elem.get('data-src')
+
+    return {
+        "title": title_elem.text.strip() if title_elem else None,
+        "price_text": price_elem.text.strip() if price_elem else None,
+        "subtitle_text": subtitle_elem.text.strip() if subtitle_elem else None,
+        "seller_name": seller_name,
+        "first_image_url": first_image_url,
+    }
+
+
+def _extract_item_fields_selectolax(html):
+    tree = HTMLParser(html)
+
+    title_elem = tree.css_first('h1.ui-pdp-title')
+    price_elem = tree.css_first('span.andes-money-amount__fraction')
+    subtitle_elem = tree.css_first('span.ui-pdp-subtitle')
+
+    seller_name = None
+    seller_elem = tree.css_first('div.ui-pdp-seller__header__title')
+    if seller_elem:
+        seller_button = seller_elem.css_first('button')
+        if seller_button:
+            seller_spans = seller_button.css('span')
+            seller_name = seller_spans[1].text().strip() if len(seller_spans) > 1 else None
+
+    first_image_url = None
+    # Same exact class attribute match as BeautifulSoup's class_ with a multi-class string
+    for image_elem in tree.css('img.ui-pdp-gallery__figure__image'):
+        if image_elem.attributes.get('class') == GALLERY_IMAGE_CLASS:
+            first_image_url = image_elem.attributes.get('src') or image_elem.attributes.get('data-src')
+            break
+
+    return {
+        "title": title_elem.text().strip() if title_elem else None,
+        "price_text": price_elem.text().strip() if price_elem else None,
+        "subtitle_text": subtitle_elem.text().strip() if subtitle_elem else None,
+        "seller_name": seller_name,
+        "first_image_url": first_image_url,
+    }
+
+
+def compare_backends(html: str, extract, repeat: int = 20):
+    """
+    Time an extraction function on every available backend and check they agree.
+    Args:
+        html: The html of the page.
+        extract: extract_search_results or extract_item_fields.
+        repeat: How many times each backend parses the page.
+    Returns:
+        A dictionary of backend name to average seconds per parse.
+    """
+    timings = {}
+    reference = None
+    for backend in available_backends():
+        started_at = time.perf_counter()
+        for _ in range(repeat):
+            output = extract(html, backend)
+        timings[backend] = (time.perf_counter() - started_at) / repeat
+
+        if reference is None:
+            reference = output
+        elif output != reference:
+            raise AssertionError(f"Backend {backend} output differs from {available_backends()[0]}")
+    return timings
+
+
+if __name__ == "__main__":
+    # python html_parsers.py search|item saved_page.html [...]
+    # Time real captured pages: the hand-written benchmarks/fixtures are a few KB and say nothing about full pages
+    kind, paths = sys.argv[1], sys.argv[2:]
+    extract = extract_search_results if kind == "search" else extract_item_fields
+    for path in paths:
+        with open(path, encoding="utf-8") as page:
+            timings = compare_backends(page.read(), extract)
+        baseline = timings[HTML_PARSER]
+        for backend, seconds in timings.items():
+            print(f"{path}: {backend:12} {seconds * 1000:8.2f} ms  x{baseline / seconds:.1f}")
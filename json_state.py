@@ -0,0 +1,180 @@
+import json
+import re
+from logging_config import set_up_logger
+
+logger = set_up_logger(__name__)
+
+_JSON_LD_OPENING = '<script type="application/ld+json"'
+_PRELOADED_STATE_MARKERS = ('window.__PRELOADED_STATE__', 'id="__PRELOADED_STATE__"')
+_CONDITIONS = {
+    "NewCondition": "Nuevo",
+    "UsedCondition": "Usado",
+    "RefurbishedCondition": "Reacondicionado",
+}
+_decoder = json.JSONDecoder()
+# schema.org prices use a dot for decimals, more than two digits after it is a thousands separator ("25.900")
+_JSON_LD_PRICE_PATTERN = re.compile(r'\d+(\.\d{1,2})?')
+
+
+def _iter_json_ld_blobs(html: str):
+    start = html.find(_JSON_LD_OPENING)
+    while start != -1:
+        content_start = html.find('>', start) + 1
+        content_end = html.find('</script>', content_start)
+        if content_start == 0 or content_end == -1:
+            return
+        try:
+            yield json.loads(html[content_start:content_end])
+        except ValueError:
+            logger.debug("Skipping a JSON-LD block that is not valid JSON")
+        start = html.find(_JSON_LD_OPENING, content_end)
+
+
+def find_json_ld_product(html: str):
+    """
+    Find the schema.org Product of the page with a string scan, without parsing the DOM.
+    Args:
+        html: The html of the item page.
+    Returns:
+        The Product dictionary, or None if the page has none.
+    """
+    for blob in _iter_json_ld_blobs(html):
+        candidates = blob if isinstance(blob, list) else blob.get("@graph", [blob]) if isinstance(blob, dict) else []
+        for candidate in candidates:
+            if isinstance(candidate, dict) and candidate.get("@type") == "Product":
+                return candidate
+    return None
+
+
+def find_preloaded_state(html: str):
+    """
+    Decode the preloaded state object the page hydrates from.
+    Args:
+        html: The html of the item page.
+    Returns:
+        The decoded state, or None if the page has none.
+    """
+    for marker in _PRELOADED_STATE_MARKERS:
+        position = html.find(marker)
+        if position == -1:
+            continue
+        object_start = html.find('{', position)
+        if object_start == -1:
+            continue
+        try:
+            state, _ = _decoder.raw_decode(html, object_start)
+            return state
+        except ValueError:
+            logger.debug("Preloaded state is not valid JSON")
+    return None
+
+
+# Where the state keeps the components of the item itself, the rest of it holds
+# recommendations and ads with their own titles, prices and sellers
+_ITEM_COMPONENTS_PATHS = (("initialState", "components"), ("components",))
+_SELLER_COMPONENTS = ("seller", "seller_info", "seller_data")
+
+
+def _get(node, *path):
+    for key in path:
+        if isinstance(key, int):
+            node = node[key] if isinstance(node, list) and len(node) > key else None
+        else:
+            node = node.get(key) if isinstance(node, dict) else None
+    return node
+
+
+def _find_item_components(state):
+    for path in _ITEM_COMPONENTS_PATHS:
+        components = _get(state, *path)
+        if isinstance(components, dict):
+            return components
+    return None
+
+
+def _find_seller_name(components):
+    # Left to the DOM when the seller components disagree
+    names = set()
+    for key in _SELLER_COMPONENTS:
+        seller = components.get(key)
+        if isinstance(seller, dict):
+            name = next((seller[name_key] for name_key in ("name", "nickname", "title") if isinstance(seller.get(name_key), str)), None)
+            if name:
+                names.add(name)
+    return names.pop() if len(names) == 1 else None
+
+
+def _string(value):
+    return value.strip() or None if isinstance(value, str) else None
+
+
+def _extract_state_fields(state):
+    components = _find_item_components(state)
+    if components is None:
+        return {}
+    subtitle = _string(_get(components, "header", "subtitle"))  # "Nuevo | +100 vendidos"
+    return {
+        "title": _string(_get(components, "header", "title")),
+        "price": _parse_offer_price(_get(components, "price", "price", "value")),
+        "currency": _string(_get(components, "price", "price", "currency_id")),
+        "condition": _string(subtitle.split("|")[0]) if subtitle else None,
+        "seller_name": _find_seller_name(components),
+        "first_image_url": _string(_get(components, "gallery", "pictures", 0, "url")),
+    }
+
+
+def _parse_offer_price(price):
+    # Left to the DOM when missing or not a plain number, e.g. "Consultar" or "25.900"
+    if isinstance(price, bool) or price is None:
+        return None
+    if isinstance(price, (int, float)):
+        return float(price)
+    if isinstance(price, str) and _JSON_LD_PRICE_PATTERN.fullmatch(price.strip()):
+        return float(price)
+    logger.debug("Ignoring the price %r", price)
+    return None
+
+
+def extract_item_state(html: str):
+    """
+    Extract the item fields from the JSON-LD Product, then fill the ones it lacks from
+    the item components of the preloaded state.
+    Args:
+        html: The html of the item page.
+    Returns:
+        A dictionary with the title, price, currency, condition, seller_name and
+        first_image_url found (None for the missing ones), or None if the page has no JSON blob.
+    """
+    product = find_json_ld_product(html)
+    state = find_preloaded_state(html)
+    if product is None and state is None:
+        return None
+
+    fields = dict.fromkeys(("title", "price", "currency", "condition", "seller_name", "first_image_url"))
+    if product is not None:
+        offers = product.get("offers") or {}
+        if isinstance(offers, list):
+            offers = offers[0] if offers else {}
+
+        fields["title"] = product.get("name")
+        fields["price"] = _parse_offer_price(offers.get("price"))
+        fields["currency"] = offers.get("priceCurrency")
+
+        condition = offers.get("itemCondition") or product.get("itemCondition")
+        if condition:
+            condition = condition.rsplit('/', 1)[-1]
+            fields["condition"] = _CONDITIONS.get(condition, condition)
+
+        image = product.get("image")
+        fields["first_image_url"] = image[0] if isinstance(image, list) and image else image or None
+
+        seller = offers.get("seller")
+        if isinstance(seller, dict):
+            fields["seller_name"] = seller.get("name")
+
+    if state is not None:
+        for field, value in _extract_state_fields(state).items():
+            if fields[field] is None:
+                fields[field] = value
+
+    return fields
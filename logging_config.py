@@ -1,5 +1,108 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
+
+# One queue and background writer per log destination, shared by every logger writing there
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate_per_second: float, burst: int = None, max_level: int = logging.INFO):
+        """
+        Drop records of a message template logged more than rate_per_second times per second
+
+        Records are grouped by their unformatted message, so with lazy %-style arguments
+        every call site gets its own budget. Records above max_level always pass.
+
+        Args:
+            rate_per_second: Sustained number of records allowed per message template
+            burst: Records allowed at once before limiting, defaults to rate_per_second
+            max_level: Highest level that can be dropped
+        """
+        super().__init__()
+        self.rate_per_second = rate_per_second
+        self.burst = burst or max(1, int(rate_per_second))
+        self.max_level = max_level
+        self._buckets = {}  # message template -> (tokens, last refill time)
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, refilled_at = self._buckets.get(record.msg, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - refilled_at) * self.rate_per_second)
+            allowed = tokens >= 1
+            self._buckets[record.msg] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.direct_handlers = None  # Set in forked children, which have no writer thread
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock handler formats the message in the calling thread, leave it to the writer
+        return record
+
+    def emit(self, record: logging.LogRecord):
+        if self.direct_handlers is None:
+            return super().emit(record)
+        for handler in self.direct_handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def _get_queue_handler(file_name: str, file_mode: str, format: str, console_output: bool) -> logging.Handler:
+    key = (file_name, file_mode, format, console_output)
+    with _listeners_lock:
+        if key not in _listeners:
+            formatter = logging.Formatter(format)
+            handlers = [logging.FileHandler(f"logs/{file_name}", mode=file_mode)]
+            if console_output:
+                handlers.append(logging.StreamHandler())
+            for handler in handlers:
+                handler.setFormatter(formatter)
+
+            log_queue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+            listener.start()
+            _listeners[key] = (_DeferredQueueHandler(log_queue), listener)
+        return _listeners[key][0]
+
+
+@atexit.register
+def _stop_listeners():
+    with _listeners_lock:
+        for _, listener in _listeners.values():
+            if listener is not None:
+                listener.stop()  # Writes whatever is still queued
+        _listeners.clear()
+
+
+def _write_directly_in_child():
+    # A forked child inherits the queue handlers but not the writer threads, so nothing would
+    # drain its records. Pool workers also leave through os._exit, skipping atexit, so the
+    # child writes synchronously instead of starting writers of its own.
+    global _listeners_lock
+    _listeners_lock = threading.Lock()  # May have been held by another thread of the parent
+    for key, (handler, listener) in list(_listeners.items()):
+        if listener is not None:
+            handler.direct_handlers = listener.handlers
+        _listeners[key] = (handler, None)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_write_directly_in_child)
+
 
 def set_up_logger(
         name:str, 
@@ -7,7 +110,9 @@ def set_up_logger(
         file_name:str="general_logs.log", 
         file_mode:str="a", 
         format:str="%(asctime)s -- %(levelname)s -- %(module)s -- %(message)s",
-        console_output:bool=True
+        console_output:bool=True,
+        async_mode:bool=None,
+        rate_limit_per_second:float=None,
         ) -> logging.Logger:
     log_level = os.getenv("LOGGING_LEVEL", "WARNING").upper()  # Get the name of the level
     log_level = getattr(logging, log_level, logging.WARNING)  # Get the attribute specified, else, 
@@ -15,20 +120,32 @@ def set_up_logger(
     logger = logging.getLogger(name)
     logger.setLevel(log_level)
 
+    # Async mode hands records to a background writer thread instead of writing them in the caller
+    if async_mode is None:
+        async_mode = os.getenv("LOGGING_ASYNC", "").lower() in ("1", "true", "yes")
+    if rate_limit_per_second is None and os.getenv("LOGGING_RATE_LIMIT"):
+        rate_limit_per_second = float(os.getenv("LOGGING_RATE_LIMIT"))
+
     if not logger.hasHandlers():  # In case an already created logger was called
-        # File handler
-        handler = logging.FileHandler(f"logs/{file_name}", mode=file_mode)
-        formatter = logging.Formatter(format)
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        
-        # Console handler
-        if console_output:
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(formatter)
-            logger.addHandler(console_handler)
+        if async_mode:
+            logger.addHandler(_get_queue_handler(file_name, file_mode, format, console_output))
+        else:
+            # File handler
+            handler = logging.FileHandler(f"logs/{file_name}", mode=file_mode)
+            formatter = logging.Formatter(format)
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
+
+            # Console handler
+            if console_output:
+                console_handler = logging.StreamHandler()
+                console_handler.setFormatter(formatter)
+                logger.addHandler(console_handler)
+
+        if rate_limit_per_second:  # Sample the per-item messages of the hot loops
+            logger.addFilter(RateLimitFilter(rate_limit_per_second))
 
     for extra in extra_handlers:  # In case the user want to log in any other place than files
         logger.addHandler(extra)
 
-    return logger
\ No newline at end of file
+    return logger
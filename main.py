@@ -1,37 +1,293 @@
-from scraping import perform_item_page_scrapping, perform_main_search_page_scrapping
+import argparse
+import logging
+import asyncio
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from scraping import perform_item_page_scrapping, perform_main_search_page_scrapping, perform_card_scrapping, SEARCH_WORKERS
 from scraping import set_up_logger
 logger = set_up_logger(__name__)
-from mongo_manager import MongoManager
+from mongo_manager import MongoManager, BulkWriter
+from driver_pool import DriverPool
+from fetcher import configure_default_page_cache, configure_default_http_pool
+from pipeline import run_pipeline
+from seen_index import SeenIndex, filter_unseen
+from frontier import CrawlFrontier
+from batch_runner import Job, load_jobs, run_batch
+from task_queue import MongoTaskQueue
+from distributed import run_coordinator, run_worker
+from exporter import open_exporter
+from metrics import metrics_registry
 
 mongo_manager: MongoManager = MongoManager()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape MercadoLibre search results into MongoDB")
+    parser.add_argument("--role", choices=["local", "coordinator", "worker"], default="local",
+                        help="local runs the whole crawl here, coordinator only searches and queues the items in Mongo, "
+                             "worker scrapes items leased from that queue (default: local)")
+    parser.add_argument("--lease-seconds", type=float, default=300,
+                        help="How long a worker owns a leased item before another worker can take it (default: 300)")
+    parser.add_argument("--idle-timeout", type=float, default=60,
+                        help="Seconds a worker waits for new items before stopping, -1 to run forever (default: 60)")
+    parser.add_argument("--worker-id", default=None,
+                        help="Identifies the worker in its leases (default: hostname-pid)")
+    parser.add_argument("--jobs", default=None,
+                        help="Run every job of this CSV or JSON Lines file (query, category, pages) over one shared worker budget")
+    parser.add_argument("--query", default=None,
+                        help="The query to search for, asked interactively if neither it nor --jobs is given")
+    parser.add_argument("--category", default=None,
+                        help="The category to classify the items in, asked interactively if not given")
+    parser.add_argument("--pages", type=int, default=None,
+                        help="How many search pages to scrape, -1 for all of them, asked interactively if not given")
+    parser.add_argument("--print-results", action="store_true",
+                        help="Log the title of every search result and the fields of every scraped item")
+    parser.add_argument("--fast", action="store_true",
+                        help="Build the items from the search result cards, fetching item pages only for cards missing a field")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of item pages scraped concurrently (default: 1, serial)")
+    parser.add_argument("--executor", choices=["threads", "processes"], default="threads",
+                        help="Run the item page workers as threads or processes (default: threads)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Stream search pages, item pages and DB writes through an asyncio pipeline")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="Number of documents written per bulk upsert (default: 100)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only rewrite items whose fields changed, touch last_seen on the rest and keep a monthly price history")
+    parser.add_argument("--freshness-hours", type=float, default=24,
+                        help="Skip items scraped within this many hours, 0 to scrape everything (default: 24)")
+    parser.add_argument("--exact-seen-set", action="store_true",
+                        help="Track scraped items in an exact set instead of a Bloom filter")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Cache fetched pages in this directory (default: no cache)")
+    parser.add_argument("--cache-ttl-hours", type=float, default=24,
+                        help="Refetch cached pages older than this many hours (default: 24)")
+    parser.add_argument("--cache-max-mb", type=float, default=1024,
+                        help="Evict the least recently used pages above this compressed size (default: 1024)")
+    parser.add_argument("--replay", action="store_true",
+                        help="Re-run the extraction from the page cache only, without network or browser")
+    parser.add_argument("--frontier", default="cache/frontier.sqlite3",
+                        help="SQLite file recording the state of every url, so an interrupted crawl resumes (default: cache/frontier.sqlite3)")
+    parser.add_argument("--no-frontier", action="store_true",
+                        help="Do not record the crawl, a restarted run searches and scrapes everything again")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="Times a failed item is tried, across runs or worker leases, before it is given up (default: 3)")
+    parser.add_argument("--export", default=None,
+                        help="Also write the scraped items to this .csv, .parquet or .arrow file while scraping (default: off)")
+    parser.add_argument("--export-batch-size", type=int, default=10_000,
+                        help="Items kept in memory before they are written to the export file as one group (default: 10000)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on this port at /metrics (default: off)")
+    parser.add_argument("--metrics-snapshot", default=None,
+                        help="Write a JSON snapshot of the metrics to this file periodically (default: off)")
+    parser.add_argument("--metrics-interval", type=float, default=10,
+                        help="Seconds between metrics snapshots (default: 10)")
+    args = parser.parse_args()
+    if args.replay and not args.cache_dir:
+        parser.error("--replay serves pages from the page cache and needs --cache-dir")
+    if args.export and args.role != "local":
+        parser.error("--export is only supported with --role local")
+    if args.role != "local" and (args.pipeline or args.executor == "processes"):
+        parser.error("--role coordinator and worker run on threads and cannot be combined with --pipeline or --executor processes")
+    if args.role == "coordinator" and not (args.jobs or (args.query and args.category)):
+        parser.error("--role coordinator needs --jobs, or --query and --category")
+    if args.jobs and (args.pipeline or args.executor == "processes"):
+        parser.error("--jobs runs on threads and cannot be combined with --pipeline or --executor processes")
+    return args
+
+
+def scrape_items(results, category, workers=1, executor_type="threads", cache_config=None, on_failure=None, fast=False):
+    """
+    Scrape the item pages of the search results, concurrently if workers > 1.
+    Args:
+        results: The list of dictionaries with the title and url of the items.
+        category: The category to classify the items in.
+        workers: The number of concurrent workers.
+        executor_type: "threads" or "processes".
+        cache_config: Arguments of configure_default_page_cache, applied in every worker process.
+        on_failure: Called with the result and the exception of every item that fails.
+        fast: Build the items from their search result cards, see perform_card_scrapping.
+    Returns:
+        A generator of Mercado_Libre_Object in the order they finish. Items that
+        fail are logged and skipped.
+    """
+    if workers <= 1:
+        for result in results:
+            logger.info("Scraping item: %s", result['title'])
+            try:
+                yield perform_card_scrapping(result, category) if fast else perform_item_page_scrapping(result['url'], category)
+            except Exception as e:
+                logger.error("Failed to scrape item %s: %s", result['url'], e)
+                if on_failure is not None:
+                    on_failure(result, e)
+        return
+
+    driver_pool = None
+    if executor_type == "processes":
+        # Every process keeps its own default driver pool
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=configure_default_page_cache, initargs=cache_config or ())
+        driver_pool_kwargs = {}
+    else:
+        driver_pool = DriverPool(max_drivers_per_type=workers)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        driver_pool_kwargs = {"driver_pool": driver_pool}
+
+    logger.info(f"Scraping {len(results)} items with {workers} {executor_type}")
+    try:
+        with executor:
+            futures = {
+                (
+                    executor.submit(perform_card_scrapping, result, category, **driver_pool_kwargs) if fast
+                    else executor.submit(perform_item_page_scrapping, result['url'], category, **driver_pool_kwargs)
+                ): result
+                for result in results
+            }
+            for future in as_completed(futures):
+                result = futures[future]
+                try:
+                    yield future.result()
+                except Exception as e:
+                    logger.error("Failed to scrape item %s: %s", result['url'], e)
+                    if on_failure is not None:
+                        on_failure(result, e)
+    finally:
+        if driver_pool is not None:
+            driver_pool.close()
+
+
 def main():
-    desired_search = input("What are you looking for? ")
-    number_of_pages = int(input("How many pages do you want to scrape? "))
-    print_results = input("Do you want to print the results? (y/n) ")
-    category = input("In what category do you want to clasify the items? ")
+    args = parse_args()
+
+    if args.metrics_port is not None:
+        metrics_registry.start_http_server(args.metrics_port)
+    stop_snapshot_writer = None
+    if args.metrics_snapshot:
+        stop_snapshot_writer = metrics_registry.start_snapshot_writer(args.metrics_snapshot, args.metrics_interval)
+
+    try:
+        run(args)
+    finally:
+        if stop_snapshot_writer is not None:
+            stop_snapshot_writer()
+        print(metrics_registry.summary())
+
+
+def run(args):
+    mongo_manager.ensure_indexes()
+
+    cache_config = (args.cache_dir, args.cache_ttl_hours * 3600, int(args.cache_max_mb * 1024 ** 2), args.replay)
+    configure_default_page_cache(*cache_config)
+    # The pipeline fetches item and search pages at once, so size the pool for both
+    configure_default_http_pool(args.workers + SEARCH_WORKERS)
+
+    task_queue = MongoTaskQueue(mongo_manager, lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+    if args.role == "worker":
+        run_worker(mongo_manager, task_queue, worker_id=args.worker_id, threads=args.workers, batch_size=args.batch_size,
+                   idle_timeout=None if args.idle_timeout < 0 else args.idle_timeout, incremental=args.incremental, fast=args.fast)
+        return
+
+    seen_index = SeenIndex(use_bloom_filter=not args.exact_seen_set)
+    if args.freshness_hours > 0 and not args.replay:  # A replay re-extracts everything
+        seen_index.load_from_mongo(mongo_manager, timedelta(hours=args.freshness_hours))
+
+    if args.role == "coordinator":
+        jobs = load_jobs(args.jobs) if args.jobs else [Job(args.query, args.category, args.pages if args.pages is not None else 10)]
+        run_coordinator(jobs, task_queue, workers=args.workers, seen_index=seen_index)
+        return
+
+    frontier = None
+    if not args.no_frontier and not args.replay:  # A replay re-extracts everything
+        frontier = CrawlFrontier(args.frontier, max_attempts=args.max_attempts)
+    exporter = open_exporter(args.export, args.export_batch_size) if args.export else None
+
+    if args.jobs:
+        try:
+            job_stats = run_batch(load_jobs(args.jobs), mongo_manager, workers=args.workers, batch_size=args.batch_size, seen_index=seen_index, frontier=frontier, incremental=args.incremental, fast=args.fast, exporter=exporter)
+        finally:
+            if frontier is not None:
+                frontier.close()
+            if exporter is not None:
+                exporter.close()
+        for stats in job_stats:
+            logger.info(f"Job {stats['query']!r} ({stats['category']}): {stats['scraped']}/{stats['queued']} items scraped, {stats['failed']} failed, {stats['skipped']} skipped")
+        return
+
+    # A single query, from the flags or asked interactively
+    desired_search = args.query or input("What are you looking for? ")
+    number_of_pages = args.pages if args.pages is not None else int(input("How many pages do you want to scrape? "))
+    if args.print_results or args.query:
+        print_results = "y" if args.print_results else "n"
+    else:
+        print_results = input("Do you want to print the results? (y/n) ")
+    category = args.category or input("In what category do you want to clasify the items? ")
+
+    try:
+        scrape(args, desired_search, number_of_pages, print_results, category, cache_config, seen_index, frontier, exporter)
+    finally:
+        if frontier is not None:
+            logger.info(f"Crawl frontier: {frontier.counts(desired_search, category)}")
+            frontier.close()
+        if exporter is not None:
+            exporter.close()
+
+
+def scrape(args, desired_search, number_of_pages, print_results, category, cache_config, seen_index, frontier, exporter):
+    if args.pipeline:
+        stats = asyncio.run(run_pipeline(desired_search, category, mongo_manager, max_pages=number_of_pages, item_workers=args.workers, batch_size=args.batch_size, seen_index=seen_index, frontier=frontier, incremental=args.incremental, fast=args.fast, exporter=exporter))
+        logger.info(f"Wrote {stats['written']} mercado libre objects into the database")
+        return
+
+    on_flush = on_failure = None
+    if frontier is not None:
+        frontier.recover(desired_search, category)
+        on_flush = lambda documents: frontier.mark_done([document['url'] for document in documents])
+        on_failure = lambda result, error: frontier.mark_failed(result['url'], str(error))
+
+    found_count = skipped_count = 0
+    results = []
+    if frontier is not None and frontier.is_search_complete(desired_search, category, number_of_pages):
+        logger.info("Search already completed, resuming from the crawl frontier")
+    else:
+        if frontier is not None:
+            frontier.start_search(desired_search, category)
+        results = perform_main_search_page_scrapping(desired_search, max_pages=number_of_pages)
+        logger.info(f"Found {len(results)} results")
+        if print_results.lower().strip() == "y":
+            for idx, result in enumerate(results):
+                logger.info(f"Item {idx+1}: {result['title']}")
+
+        found_count = len(results)
+        results = filter_unseen(results, seen_index)
+        skipped_count = found_count - len(results)
+        if frontier is not None:
+            frontier.add(results, desired_search, category)
+            frontier.complete_search(desired_search, category, number_of_pages)
 
-    results = perform_main_search_page_scrapping(desired_search, max_pages=number_of_pages)
-    logger.info(f"Found {len(results)} results")
-    if print_results.lower().strip() == "y":
-        for idx, result in enumerate(results):
-            logger.info(f"Item {idx+1}: {result['title']}")
+    if frontier is not None:
+        # Includes what a previous run left unfinished, those come without their search card
+        cards = {result['url']: result for result in results}
+        results = [cards.get(result['url'], result) for result in frontier.claim(desired_search, category)]
 
-    inserted_count = 0
-    for result in results:
-        logger.info(f"Scraping item: {result['title']}")
-        item_page_result = perform_item_page_scrapping(result['url'], category)
-        logger.info(f"Scraped item: {item_page_result.to_dict()}")
+    scraped_count = 0
+    with BulkWriter(mongo_manager, batch_size=args.batch_size, on_flush=on_flush, incremental=args.incremental) as bulk_writer:
+        for item_page_result in scrape_items(results, category, workers=args.workers, executor_type=args.executor, cache_config=cache_config, on_failure=on_failure, fast=args.fast):
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Scraped item: %s", item_page_result.to_dict())
 
-        mongo_manager.create_document(item_page_result.to_dict())
-        inserted_count += 1
+            document = item_page_result.to_dict()
+            if exporter is not None:
+                exporter.add(document)
+            bulk_writer.add(document)
+            scraped_count += 1
 
-        if print_results.strip().lower() == "y":
-            item_dict = item_page_result.to_dict()
-            item_dict.pop('url', None)
-            logger.info(f"Item {idx+1}: {item_dict}")
+            if print_results.strip().lower() == "y":
+                item_dict = item_page_result.to_dict()
+                item_dict.pop('url', None)
+                logger.info("Item %s: %s", scraped_count, item_dict)
 
-    logger.info(f"Inserted {len(inserted_count)} mercado libre objects into the database")
+    logger.info(f"Wrote {scraped_count} mercado libre objects into the database: {bulk_writer.stats}")
+    logger.info(f"{skipped_count} results were skipped as already scraped")
+    if scraped_count < len(results):
+        logger.warning(f"{len(results) - scraped_count} items failed to scrape")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
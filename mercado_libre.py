@@ -1,25 +1,54 @@
+import sys
+from url_utils import extract_item_id
+
+
+def _intern(value):
+    # Categories, currencies and conditions repeat across millions of items, keep one copy of each
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class Mercado_Libre_Object:
-    def __init__(self, 
-        title: str, 
+    __slots__ = ("title", "url", "price", "currency", "condition", "seller_name", "first_image_url", "category", "_categories", "card_fields")
+
+    def __init__(self,
+        title: str,
         url: str,
-        price: float, 
-        currency: str, 
+        price: float,
+        currency: str,
         condition: str,
         seller_name: str,
         first_image_url: str,
         category: str,
+        categories: list = None,
+        card_fields: list = None,
         ):
         self.title = title
         self.url = url
         self.price = price
-        self.currency = currency
-        self.condition = condition
+        self.currency = _intern(currency)
+        self.condition = _intern(condition)
         self.seller_name = seller_name
         self.first_image_url = first_image_url
-        self.category = category
+        self.category = _intern(category)
+        self.categories = categories if categories else [category]  # Every category the item was found under
+        # Set on items built from a search card: the fields it filled with values that must not replace the item page ones
+        self.card_fields = tuple(card_fields) if card_fields is not None else None
+
+    @property
+    def categories(self):
+        return self._categories
+
+    @categories.setter
+    def categories(self, categories):
+        self._categories = tuple(_intern(category) for category in categories)
+
+    @property
+    def item_id(self):
+        return extract_item_id(self.url)
 
     def to_dict(self):
-        return {
+        document = {
+            "item_id": self.item_id,
             "title": self.title,
             "url": self.url,
             "price": self.price,
@@ -28,7 +57,14 @@ class Mercado_Libre_Object:
             "seller_name": self.seller_name,
             "first_image_url": self.first_image_url,
             "category": self.category,
+            "categories": list(self.categories),
         }
+        if self.card_fields is not None:
+            document["card_fields"] = list(self.card_fields)
+        return document
 
     def __str__(self):
-        return self.to_dict()
+        return f"{self.title} ({self.item_id or self.url}): {self.price} {self.currency}, {self.condition}"
+
+    def __repr__(self):
+        return f"Mercado_Libre_Object(title={self.title!r}, url={self.url!r}, price={self.price!r}, currency={self.currency!r}, category={self.category!r})"
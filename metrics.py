@@ -0,0 +1,224 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging_config import set_up_logger
+
+logger = set_up_logger(__name__)
+
+
+def _label_key(labels: dict):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+class _Timer:
+    def __init__(self, reservoir_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []  # Uniform reservoir sample of the observed durations
+        self.reservoir_size = reservoir_size
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.samples) < self.reservoir_size:
+            self.samples.append(seconds)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.reservoir_size:
+                self.samples[slot] = seconds
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+            "p50": _percentile(ordered, 0.50),
+            "p95": _percentile(ordered, 0.95),
+            "p99": _percentile(ordered, 0.99),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self, reservoir_size: int = 10_000):
+        """
+        Thread safe counters and stage timers of the scraper
+
+        Args:
+            reservoir_size: Durations kept per timer to compute the percentiles
+        """
+        self.reservoir_size = reservoir_size
+        self.started_at = time.time()
+        self._counters = {}  # (name, labels) -> value
+        self._timers = {}  # (name, labels) -> _Timer
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = _Timer(self.reservoir_size)
+            timer.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Time the body of the with statement, whether it raises or not"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, **labels)
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def snapshot(self) -> dict:
+        """
+        Get the current value of every counter and the summary of every timer.
+        Returns:
+            A JSON serializable dictionary.
+        """
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self._counters.items()]
+            timers = [{"name": name, "labels": dict(labels), **timer.summary()} for (name, labels), timer in self._timers.items()]
+        return {
+            "timestamp": time.time(),
+            "uptime_seconds": time.time() - self.started_at,
+            "counters": counters,
+            "timers": timers,
+        }
+
+    def to_prometheus(self, prefix: str = "scraper") -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+        Returns:
+            The text of the /metrics page.
+        """
+        def render_labels(labels, **extra):
+            pairs = {**labels, **extra}
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs.items()) + "}"
+
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for counter in sorted(snapshot["counters"], key=lambda c: c["name"]):
+            name = f"{prefix}_{counter['name']}_total"
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{render_labels(counter['labels'])} {counter['value']}")
+        for timer in sorted(snapshot["timers"], key=lambda t: t["name"]):
+            name = f"{prefix}_{timer['name']}_seconds"
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} summary")
+            for quantile, label in (("p50", "0.5"), ("p95", "0.95"), ("p99", "0.99")):
+                if timer[quantile] is not None:
+                    lines.append(f"{name}{render_labels(timer['labels'], quantile=label)} {timer[quantile]}")
+            lines.append(f"{name}_sum{render_labels(timer['labels'])} {timer['sum']}")
+            lines.append(f"{name}_count{render_labels(timer['labels'])} {timer['count']}")
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """
+        Serve the Prometheus text on http://host:port/metrics from a background thread.
+        Returns:
+            The running server, call shutdown() to stop it.
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep scrapes of the endpoint out of the logs
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return server
+
+    def start_snapshot_writer(self, path: str, interval_seconds: float = 10):
+        """
+        Write a JSON snapshot to path every interval_seconds from a background thread.
+        Returns:
+            A function that writes a last snapshot and stops the thread.
+        """
+        stop = threading.Event()
+
+        def write_snapshots():
+            while True:
+                stopping = stop.wait(interval_seconds)
+                temporary_path = f"{path}.tmp"
+                with open(temporary_path, "w", encoding="utf-8") as snapshot_file:
+                    json.dump(self.snapshot(), snapshot_file, indent=2)
+                os.replace(temporary_path, path)
+                if stopping:
+                    return
+
+        writer = threading.Thread(target=write_snapshots, name="MetricsSnapshotWriter", daemon=True)
+        writer.start()
+
+        def stop_writer():
+            stop.set()
+            writer.join()
+
+        return stop_writer
+
+    def summary(self, items_counter: str = "items_scraped") -> str:
+        """
+        Human readable end of run summary: items per second and the latency of every stage.
+        Returns:
+            The summary text.
+        """
+        snapshot = self.snapshot()
+        items = sum(c["value"] for c in snapshot["counters"] if c["name"] == items_counter)
+        elapsed = snapshot["uptime_seconds"]
+
+        lines = [f"{items:.0f} items in {elapsed:.1f}s ({items / elapsed if elapsed else 0:.2f} items/sec)"]
+        for counter in sorted(snapshot["counters"], key=lambda c: (c["name"], str(c["labels"]))):
+            labels = "".join(f" {key}={value}" for key, value in counter["labels"].items())
+            lines.append(f"  {counter['name']}{labels}: {counter['value']:.0f}")
+        for timer in sorted(snapshot["timers"], key=lambda t: t["name"]):
+            if timer["count"]:
+                lines.append(
+                    f"  {timer['name']}: n={timer['count']} "
+                    f"p50={timer['p50'] * 1000:.1f}ms p95={timer['p95'] * 1000:.1f}ms "
+                    f"p99={timer['p99'] * 1000:.1f}ms max={timer['max'] * 1000:.1f}ms"
+                )
+        return "\n".join(lines)
+
+
+# Process wide registry every stage reports to
+metrics_registry = MetricsRegistry()
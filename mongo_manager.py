@@ -1,21 +1,60 @@
-from pymongo import MongoClient
+import hashlib
+import json
+import threading
+import time
+from pymongo import MongoClient, UpdateOne, InsertOne, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, OperationFailure
 from bson import ObjectId
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterator, Tuple
 from logging_config import set_up_logger
+from metrics import metrics_registry
 from dotenv import load_dotenv
 
 logger = set_up_logger(__name__)
 load_dotenv()
 
+# Extracted fields of a Mercado_Libre_Object whose change makes a document worth rewriting
+HASHED_FIELDS = ("title", "price", "currency", "condition", "seller_name", "first_image_url")
+
+
+def content_hash(document: Dict[str, Any], fields=HASHED_FIELDS) -> str:
+    """
+    Fingerprint the extracted fields of a document.
+    Args:
+        document: The document, usually Mercado_Libre_Object.to_dict().
+        fields: The fields that are hashed.
+    Returns:
+        The hex digest of the fields.
+    """
+    payload = json.dumps([document.get(field) for field in fields], default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _update_fields(document: Dict[str, Any], add_to_set_fields) -> tuple:
+    # Items built from a search card leave out what the card did not show, and their card_fields
+    # only fill new documents, so a fast run never overwrites what an item page stored
+    fields = {field: value for field, value in document.items() if field not in ('created_at', 'card_fields') and field not in add_to_set_fields}
+    card_fields = document.get('card_fields')
+    if card_fields is None:
+        return fields, {}
+    insert_only = {field: fields.pop(field) for field in card_fields if field in fields}
+    return {field: value for field, value in fields.items() if value is not None}, insert_only
+
+
+def _without_card_fields(document: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: value for field, value in document.items() if field != 'card_fields'}
+
+
 class MongoManager:
-    def __init__(self, *, connection_string: str = None, database_name: str = None):
+    def __init__(self, *, connection_string: str = None, database_name: str = None, client: MongoClient = None):
         """
         Initialize MongoDB connection manager
         
         Args:
             connection_string: MongoDB connection string
             database_name: Name of the database to use
+            client: An already built client (e.g. a local stand-in), used instead of connection_string
         """
         import os
         
@@ -25,14 +64,14 @@ class MongoManager:
         if database_name is None:
             database_name = os.getenv('DATABASE_NAME')
             
-        if not connection_string:
+        if not connection_string and client is None:
             raise ValueError("MongoDB connection string must be provided either as parameter or MONGO_CONNECTION_STRING environment variable")
         if not database_name:
             raise ValueError("Database name must be provided either as parameter or DATABASE_NAME environment variable")
             
         logger.info(f"Initializing MongoDB connection to database: {database_name}")
         try:
-            self.client = MongoClient(connection_string)
+            self.client = client if client is not None else MongoClient(connection_string)
             self.db = self.client[database_name]
             logger.info("MongoDB connection established successfully")
         except Exception as e:
@@ -50,8 +89,8 @@ class MongoManager:
         Returns:
             List of document IDs
         """
-        logger.info(f"Inserting multiple documents into collection: {collection_name}")
-        logger.debug(f"Documents: {documents}")
+        logger.info("Inserting multiple documents into collection: %s", collection_name)
+        logger.debug("Documents: %s", documents)
         
         try:
             collection = self.db[collection_name]
@@ -63,6 +102,117 @@ class MongoManager:
             logger.error(f"Failed to insert documents into collection {collection_name}: {e}")
             raise
 
+    def bulk_write(self, operations: List[Any], collection_name: str="Items", ordered: bool=False):
+        """
+        Run a batch of write operations in a single round trip
+        
+        Args:
+            operations: pymongo write operations (InsertOne, UpdateOne, ...)
+            collection_name: Name of the collection
+            ordered: Whether to stop at the first failing operation
+            
+        Returns:
+            The pymongo BulkWriteResult
+        """
+        logger.info("Bulk writing %s operations into collection: %s", len(operations), collection_name)
+        
+        try:
+            collection = self.db[collection_name]
+            with metrics_registry.timer("mongo_bulk_write"):
+                result = collection.bulk_write(operations, ordered=ordered)
+            metrics_registry.increment("mongo_documents_written", len(operations))
+            logger.info("Bulk write done: %s upserted, %s modified, %s inserted", result.upserted_count, result.modified_count, result.inserted_count)
+            return result
+        except Exception as e:
+            logger.error(f"Failed to bulk write into collection {collection_name}: {e}")
+            raise
+
+    def write_changes(
+            self,
+            documents: List[Dict[str, Any]],
+            collection_name: str="Items",
+            *,
+            key: str="item_id",
+            history_collection_name: str="PriceHistory",
+            add_to_set_fields=("categories",),
+            ):
+        """
+        Write only what changed since the stored version of each document
+        
+        Stored fingerprints are read in one query. Documents whose content_hash did not
+        change only get their last_seen touched, the rest are rewritten. Documents built
+        from a search card are hashed over what the stored document will hold once they
+        are merged in, so switching between fast and full runs does not count as a change. Every new price is
+        appended to the item's bucket of the month in the history collection, instead of
+        keeping a full document per observation.
+        
+        Args:
+            documents: The documents to write, keyed by key
+            collection_name: Name of the collection
+            key: Field that identifies a document across runs
+            history_collection_name: Collection of the monthly price buckets
+            add_to_set_fields: List fields merged into the stored ones instead of replacing them
+            
+        Returns:
+            The pymongo BulkWriteResult of the documents, and a dictionary with the number
+            of new, changed and unchanged documents and appended price points
+        """
+        now = datetime.now(timezone.utc)
+        collection = self.db[collection_name]
+        keys = [document[key] for document in documents if document.get(key) is not None]
+        stored = {
+            previous[key]: previous
+            for previous in collection.find({key: {"$in": keys}}, {key: 1, "content_hash": 1, **{field: 1 for field in HASHED_FIELDS}, "_id": 0})
+        }
+
+        counts = {"new": 0, "changed": 0, "unchanged": 0, "price_points": 0}
+        operations = []
+        history = []
+        for document in documents:
+            fields, insert_only = _update_fields(document, add_to_set_fields)
+            merged = {field: {"$each": list(document[field])} for field in add_to_set_fields if document.get(field)}
+            key_value = document.get(key)
+            if key_value is None:
+                operations.append(InsertOne({**_without_card_fields(document), "created_at": document.get('created_at', now), "last_seen": now}))
+                counts["new"] += 1
+                continue
+
+            previous = stored.get(key_value)
+            if 'card_fields' in document:
+                digest = content_hash({**(previous if previous is not None else insert_only), **fields})
+            else:
+                digest = content_hash(document)
+            if previous is not None and previous.get("content_hash") == digest:
+                update = {"$set": {"last_seen": now}}
+                counts["unchanged"] += 1
+            else:
+                fields.update(content_hash=digest, updated_at=now, last_seen=now)
+                update = {"$set": fields, "$setOnInsert": {**insert_only, "created_at": document.get('created_at', now)}}
+                counts["changed" if previous is not None else "new"] += 1
+
+                # Items written before incremental mode have no content_hash and no price point yet
+                first_tracked = previous is None or previous.get("content_hash") is None
+                price_moved = first_tracked or (previous.get("price"), previous.get("currency")) != (document.get("price"), document.get("currency"))
+                if document.get("price") is not None and price_moved:
+                    history.append(UpdateOne(
+                        {key: key_value, "month": now.strftime("%Y-%m")},
+                        {"$push": {"prices": {"at": now, "price": document["price"], "currency": document.get("currency")}}, "$inc": {"count": 1}},
+                        upsert=True,
+                    ))
+            if merged:
+                update["$addToSet"] = merged
+            operations.append(UpdateOne({key: key_value}, update, upsert=True))
+
+        result = self.bulk_write(operations, collection_name, ordered=False)
+        if history:
+            try:
+                self.bulk_write(history, history_collection_name, ordered=False)
+                counts["price_points"] = len(history)
+            except Exception as e:  # The items are written, a missed price point is not worth failing the batch
+                logger.error(f"Failed to append {len(history)} price points: {e}")
+        metrics_registry.increment("mongo_unchanged_documents", counts["unchanged"])
+        return result, counts
+
     def create_document(self, document: Dict[str, Any], collection_name: str="Items") -> str:
         """
         Create a new document in the specified collection
@@ -74,8 +224,8 @@ class MongoManager:
         Returns:
             String representation of the inserted document's ObjectId
         """
-        logger.info(f"Creating document in collection: {collection_name}")
-        logger.debug(f"Document data: {document}")
+        logger.info("Creating document in collection: %s", collection_name)
+        logger.debug("Document data: %s", document)
         
         try:
             collection = self.db[collection_name]
@@ -84,9 +234,11 @@ class MongoManager:
             if 'created_at' not in document:
                 document['created_at'] = datetime.now(timezone.utc)
             
-            result = collection.insert_one(document)
+            with metrics_registry.timer("mongo_insert_one"):
+                result = collection.insert_one(document)
+            metrics_registry.increment("mongo_documents_written")
             document_id = str(result.inserted_id)
-            logger.info(f"Document created successfully with ID: {document_id}")
+            logger.info("Document created successfully with ID: %s", document_id)
             return document_id
         except Exception as e:
             logger.error(f"Failed to create document in collection {collection_name}: {e}")
@@ -125,6 +277,8 @@ class MongoManager:
         """
         Find multiple documents in the collection
         
+        Loads every match in memory, use iter_documents for large reads.
+        
         Args:
             collection_name: Name of the collection
             query: Query to match documents (empty dict for all documents)
@@ -133,24 +287,94 @@ class MongoManager:
         Returns:
             List of found documents
         """
-        logger.info(f"Finding documents in collection: {collection_name}")
-        logger.debug(f"Query: {query}, Limit: {limit}")
+        results = list(self.iter_documents(collection_name, query, limit=limit))
+        logger.info(f"Found {len(results)} documents")
+        return results
+    
+    def iter_documents(
+            self,
+            collection_name: str="Items",
+            query: Dict[str, Any] = None,
+            *,
+            projection: Dict[str, Any] = None,
+            ranges: Dict[str, Tuple[Any, Any]] = None,
+            sort: List[Tuple[str, int]] = None,
+            batch_size: int = 1000,
+            limit: int = None,
+            ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the documents of the collection, batch_size at a time
         
-        try:
-            collection = self.db[collection_name]
-            cursor = collection.find(query or {})
+        Args:
+            collection_name: Name of the collection
+            query: Query to match documents, e.g. {"category": "phones"}
+            projection: Fields to return, e.g. {"title": 1, "price": 1, "_id": 0}
+            ranges: Inclusive bounds per field, e.g. {"price": (100000, 500000)}. None leaves that side open
+            sort: List of (field, ASCENDING or DESCENDING)
+            batch_size: Documents fetched from the server per round trip
+            limit: Maximum number of documents to return
             
+        Returns:
+            A generator of the found documents
+        """
+        query = dict(query or {})
+        for field, (low, high) in (ranges or {}).items():
+            bounds = {}
+            if low is not None:
+                bounds["$gte"] = low
+            if high is not None:
+                bounds["$lte"] = high
+            if bounds:
+                existing = query.get(field)
+                query[field] = {**existing, **bounds} if isinstance(existing, dict) else bounds
+        logger.info(f"Iterating documents in collection: {collection_name}")
+        logger.debug("Query: %s, Projection: %s, Sort: %s, Limit: %s", query, projection, sort, limit)
+        
+        try:
+            cursor = self.db[collection_name].find(query, projection).batch_size(batch_size)
+            if sort:
+                cursor = cursor.sort(sort)
             if limit:
                 cursor = cursor.limit(limit)
-                
-            results = list(cursor)
-            logger.info(f"Found {len(results)} documents")
-            logger.debug(f"Documents: {results}")
-            return results
+            # The server is only reached while iterating, so that is where the errors show up
+            with cursor:
+                yield from cursor
         except Exception as e:
             logger.error(f"Failed to find documents in collection {collection_name}: {e}")
             raise
     
+    def ensure_indexes(self, collection_name: str="Items", history_collection_name: str="PriceHistory"):
+        """
+        Create the indexes of the reads and writes of the scraper, if missing
+        
+        Args:
+            collection_name: Name of the items collection
+            history_collection_name: Name of the price history collection
+        """
+        logger.info(f"Ensuring indexes on collections: {collection_name}, {history_collection_name}")
+        collection = self.db[collection_name]
+        # Only string ids are unique, documents without one are plain inserts
+        item_id = IndexModel([("item_id", ASCENDING)], name="item_id_unique", unique=True, partialFilterExpression={"item_id": {"$type": "string"}})
+        try:
+            collection.create_indexes([item_id])
+        except OperationFailure as e:
+            # Duplicates left by the runs that inserted instead of upserting
+            logger.warning(f"Could not create a unique item_id index, creating a plain one: {e}")
+            collection.create_indexes([IndexModel([("item_id", ASCENDING)], name="item_id")])
+        
+        collection.create_indexes([
+            IndexModel([("category", ASCENDING), ("price", ASCENDING)], name="category_price"),
+            IndexModel([("categories", ASCENDING)], name="categories"),
+            IndexModel([("price", ASCENDING)], name="price"),
+            IndexModel([("created_at", DESCENDING)], name="created_at"),
+            IndexModel([("updated_at", DESCENDING)], name="updated_at"),
+            IndexModel([("last_seen", DESCENDING)], name="last_seen"),
+        ])
+        self.db[history_collection_name].create_indexes([
+            IndexModel([("item_id", ASCENDING), ("month", ASCENDING)], name="item_id_month", unique=True),
+        ])
+        logger.info("Indexes ensured")
+    
     def update_document(self, collection_name: str, query: Dict[str, Any], update: Dict[str, Any]) -> bool:
         """
         Update a single document in the collection
@@ -225,3 +449,164 @@ class MongoManager:
         except Exception as e:
             logger.error(f"Error closing MongoDB connection: {e}")
             raise
+
+
+class BulkWriter:
+    def __init__(self, mongo_manager: MongoManager, *, collection_name: str = "Items", key: str = "item_id", batch_size: int = 500, flush_interval: float = 5.0, on_flush=None, add_to_set_fields=("categories",), incremental: bool = False):
+        """
+        Buffer documents and write them as unordered bulk upserts
+        
+        A batch is flushed when it reaches batch_size documents or when the oldest
+        buffered document is flush_interval seconds old, whichever comes first.
+        Documents are upserted on key, so reruns update instead of duplicating.
+        
+        Args:
+            mongo_manager: The manager whose connection is used
+            collection_name: Name of the collection
+            key: Field that identifies a document across runs
+            batch_size: Number of buffered documents that triggers a flush
+            flush_interval: Maximum seconds a document waits in the buffer
+            on_flush: Called with the list of documents of every batch once they are written
+            add_to_set_fields: List fields merged into the stored ones instead of replacing them
+            incremental: Write through MongoManager.write_changes, rewriting only the changed
+                documents and recording the price history
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        self.mongo_manager = mongo_manager
+        self.collection_name = collection_name
+        self.key = key
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.add_to_set_fields = tuple(add_to_set_fields)
+        self.incremental = incremental
+
+        self._buffer = []
+        self._oldest_buffered_at = None
+        self._lock = threading.RLock()
+        self._stats = {
+            "flushes": 0,
+            "documents": 0,
+            "upserted": 0,
+            "modified": 0,
+            "matched": 0,
+            "inserted": 0,
+            "errors": 0,
+            "unchanged": 0,
+            "price_points": 0,
+            "last_batch_size": 0,
+            "flush_seconds": 0.0,
+        }
+
+        self._closed = threading.Event()
+        self._timer = None
+        if flush_interval and flush_interval > 0:
+            self._timer = threading.Thread(target=self._flush_periodically, name="BulkWriterFlush", daemon=True)
+            self._timer.start()
+
+    def add(self, document: Dict[str, Any]):
+        """Buffer a document, flushing if the batch is full"""
+        with self._lock:
+            if self._closed.is_set():
+                raise RuntimeError("BulkWriter is closed")
+            if not self._buffer:
+                self._oldest_buffered_at = time.monotonic()
+            self._buffer.append(document)
+            if len(self._buffer) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """Write every buffered document now"""
+        with self._lock:
+            if not self._buffer:
+                return
+            documents, self._buffer = self._buffer, []
+            self._oldest_buffered_at = None
+
+            started_at = time.monotonic()
+            try:
+                if self.incremental:
+                    result, counts = self.mongo_manager.write_changes(documents, self.collection_name, key=self.key, add_to_set_fields=self.add_to_set_fields)
+                    self._stats["unchanged"] += counts["unchanged"]
+                    self._stats["price_points"] += counts["price_points"]
+                else:
+                    operations = [self._to_operation(document) for document in documents]
+                    result = self.mongo_manager.bulk_write(operations, self.collection_name, ordered=False)
+                self._record(result.bulk_api_result, len(documents), started_at)
+            except BulkWriteError as e:
+                # Unordered: everything but the failing operations was applied
+                self._record(e.details, len(documents), started_at)
+                failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                self._notify([document for index, document in enumerate(documents) if index not in failed])
+                raise
+            self._notify(documents)
+
+    def _notify(self, documents: List[Dict[str, Any]]):
+        if self.on_flush is None or not documents:
+            return
+        try:
+            self.on_flush(documents)
+        except Exception as e:
+            logger.error(f"on_flush callback failed: {e}")
+
+    def _to_operation(self, document: Dict[str, Any]):
+        now = datetime.now(timezone.utc)
+        key_value = document.get(self.key)
+        if key_value is None:
+            document.setdefault('created_at', now)
+            return InsertOne(_without_card_fields(document))
+
+        fields, insert_only = _update_fields(document, self.add_to_set_fields)
+        fields['updated_at'] = now
+        update = {"$set": fields, "$setOnInsert": {**insert_only, "created_at": document.get('created_at', now)}}
+        merged = {field: {"$each": list(document[field])} for field in self.add_to_set_fields if document.get(field)}
+        if merged:
+            update["$addToSet"] = merged
+        return UpdateOne({self.key: key_value}, update, upsert=True)
+
+    def _record(self, details: Dict[str, Any], batch_size: int, started_at: float):
+        self._stats["flushes"] += 1
+        self._stats["documents"] += batch_size
+        self._stats["upserted"] += details.get("nUpserted", 0)
+        self._stats["modified"] += details.get("nModified", 0)
+        self._stats["matched"] += details.get("nMatched", 0)
+        self._stats["inserted"] += details.get("nInserted", 0)
+        self._stats["errors"] += len(details.get("writeErrors", []))
+        self._stats["last_batch_size"] = batch_size
+        self._stats["flush_seconds"] += time.monotonic() - started_at
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Flush statistics, including the average batch size and flush latency"""
+        with self._lock:
+            stats = dict(self._stats)
+        flushes = stats["flushes"]
+        stats["avg_batch_size"] = stats["documents"] / flushes if flushes else 0.0
+        stats["avg_flush_seconds"] = stats["flush_seconds"] / flushes if flushes else 0.0
+        return stats
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval / 2):
+            with self._lock:
+                due = self._oldest_buffered_at is not None and time.monotonic() - self._oldest_buffered_at >= self.flush_interval
+                if due:
+                    try:
+                        self.flush()
+                    except Exception as e:
+                        logger.error(f"Periodic flush failed: {e}")
+
+    def close(self):
+        """Flush what is left and stop the periodic flush"""
+        self._closed.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.flush()
+        logger.info(f"BulkWriter closed: {self.stats}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
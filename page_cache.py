@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from logging_config import set_up_logger
+from url_utils import canonicalize_url
+
+logger = set_up_logger(__name__)
+
+
+class PageCache:
+    def __init__(self, cache_dir: str = "cache/pages", *, ttl_seconds: float = 24 * 3600, max_bytes: int = 1024 ** 3):
+        """
+        Compressed on-disk cache of fetched pages
+
+        Pages are stored once per distinct content (named by the sha256 of the html) and
+        looked up by canonical url. Entries older than ttl_seconds are misses, and the least
+        recently used pages are evicted once the compressed size goes over max_bytes.
+
+        Args:
+            cache_dir: Directory holding the index and the compressed pages
+            ttl_seconds: Age after which a cached page is refetched, None to never expire
+            max_bytes: Maximum compressed size of the cached pages
+        """
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"), check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL REFERENCES blobs(digest),
+                fetched_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs(last_access);
+            CREATE INDEX IF NOT EXISTS entries_digest ON entries(digest);
+        """)
+        self._connection.commit()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.html.gz")
+
+    def get(self, url: str, ignore_ttl: bool = False):
+        """
+        Get a cached page.
+        Args:
+            url: The url of the page, canonicalized before the lookup.
+            ignore_ttl: Return the page even if it expired.
+        Returns:
+            The html of the page, or None on a miss.
+        """
+        key = canonicalize_url(url)
+        with self._lock:
+            row = self._connection.execute("SELECT digest, fetched_at FROM entries WHERE url = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            digest, fetched_at = row
+            if not ignore_ttl and self.ttl_seconds is not None and time.time() - fetched_at > self.ttl_seconds:
+                return None
+            self._connection.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (time.time(), digest))
+            self._connection.commit()
+
+        try:
+            with gzip.open(self._blob_path(digest), "rt", encoding="utf-8") as blob:
+                return blob.read()
+        except FileNotFoundError:
+            logger.warning(f"Cached page for {key} is missing on disk")
+            return None
+
+    def put(self, url: str, html: str):
+        """
+        Cache a page.
+        Args:
+            url: The url of the page, canonicalized before storing.
+            html: The html of the page.
+        """
+        key = canonicalize_url(url)
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        now = time.time()
+
+        with self._lock:
+            known = self._connection.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if known is None:
+                path = self._blob_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                compressed = gzip.compress(data, compresslevel=6)
+                temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temporary_path, "wb") as blob:
+                    blob.write(compressed)
+                os.replace(temporary_path, path)
+                self._connection.execute("INSERT INTO blobs (digest, size, last_access) VALUES (?, ?, ?)", (digest, len(compressed), now))
+            else:
+                self._connection.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (now, digest))
+
+            self._connection.execute("INSERT OR REPLACE INTO entries (url, digest, fetched_at) VALUES (?, ?, ?)", (key, digest, now))
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for digest, size in self._connection.execute("SELECT digest, size FROM blobs ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._connection.execute("DELETE FROM entries WHERE digest = ?", (digest,))
+            self._connection.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} pages from the page cache")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
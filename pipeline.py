@@ -0,0 +1,181 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging_config import set_up_logger
+from scraping import iter_search_pages, perform_item_page_scrapping, perform_card_scrapping
+from driver_pool import DriverPool, SEARCH_PROFILE, ITEM_PROFILE
+from fetcher import PageFetcher, get_default_fetcher
+from mongo_manager import MongoManager, BulkWriter
+from seen_index import SeenIndex, filter_unseen
+from frontier import CrawlFrontier
+from exporter import StreamingExporter
+
+logger = set_up_logger(__name__)
+
+_END = object()  # Marks the end of a queue's stream
+
+
+async def run_pipeline(
+        search_query: str,
+        category: str,
+        mongo_manager: MongoManager,
+        *,
+        max_pages: int = 10,
+        item_workers: int = 4,
+        queue_size: int = 100,
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+        fetcher: PageFetcher = None,
+        driver_pool: DriverPool = None,
+        seen_index: SeenIndex = None,
+        frontier: CrawlFrontier = None,
+        incremental: bool = False,
+        fast: bool = False,
+        exporter: StreamingExporter = None,
+        ) -> dict:
+    """
+    Run search -> item page -> Mongo as streaming stages connected by bounded queues.
+
+    Items of a search page are fetched as soon as the page is parsed, and scraped
+    objects are written as soon as they finish. When the queues are full the upstream
+    stage waits, so memory stays flat no matter how many pages are crawled.
+
+    Args:
+        search_query: The query to search for
+        category: The category to classify the items in
+        mongo_manager: Where the scraped objects are written
+        max_pages: The maximum number of search pages to scrape, -1 for all of them
+        item_workers: Number of item pages fetched concurrently
+        queue_size: Capacity of each queue between stages
+        batch_size: Documents per bulk upsert
+        flush_interval: Maximum seconds a scraped document waits before being written
+        fetcher: The fetcher shared by all stages, defaults to HTTP with Selenium fallback
+        driver_pool: The pool used by the default fetcher, sized to item_workers if not given
+        seen_index: Items in it are skipped, defaults to an empty index that only dedupes this run
+        frontier: Records the state of every url so an interrupted crawl resumes where it
+            stopped, skipping the search if it already completed
+        incremental: Only rewrite the items that changed and record their price history
+        fast: Build the items from their search result cards, see perform_card_scrapping
+        exporter: Also writes every scraped item to a file, the caller closes it
+
+    Returns:
+        Dictionary with the found, scraped, failed and written counts, the seconds
+        until the first document reached the writer and the writer's flush stats
+    """
+    owns_pool = driver_pool is None and fetcher is None
+    if owns_pool:
+        driver_pool = DriverPool(max_drivers_per_type=item_workers)
+    if fetcher is None:
+        search_fetcher = get_default_fetcher(driver_pool=driver_pool, driver_profile=SEARCH_PROFILE)
+        item_fetcher = get_default_fetcher(driver_pool=driver_pool, driver_profile=ITEM_PROFILE)
+    else:
+        search_fetcher = item_fetcher = fetcher
+
+    # One thread per item worker, plus the search and writer stages
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=item_workers + 2))
+
+    url_queue = asyncio.Queue(maxsize=queue_size)
+    object_queue = asyncio.Queue(maxsize=queue_size)
+    if seen_index is None:
+        seen_index = SeenIndex(use_bloom_filter=False)
+
+    on_flush = None
+    search_complete = False
+    if frontier is not None:
+        frontier.recover(search_query, category)
+        search_complete = frontier.is_search_complete(search_query, category, max_pages)
+        on_flush = lambda documents: frontier.mark_done([document['url'] for document in documents])
+
+    bulk_writer = BulkWriter(mongo_manager, batch_size=batch_size, flush_interval=flush_interval, on_flush=on_flush, incremental=incremental)
+    stats = {"found": 0, "skipped": 0, "scraped": 0, "failed": 0, "written": 0, "time_to_first_document": None}
+    started_at = time.monotonic()
+
+    async def claim_from_frontier(cards=()):
+        # The frontier only keeps the title and url, the card fields come from the page just parsed
+        cards = {result['url']: result for result in cards}
+        for result in await asyncio.to_thread(frontier.claim, search_query, category):
+            await url_queue.put(cards.get(result['url'], result))
+
+    async def search_stage():
+        try:
+            if search_complete:
+                logger.info(f"Search of {search_query!r} already completed, resuming from the frontier")
+            else:
+                if frontier is not None:
+                    await asyncio.to_thread(frontier.start_search, search_query, category)
+                pages = iter_search_pages(search_query, max_pages=max_pages, fetcher=search_fetcher)
+                while True:
+                    # The blocking generator runs in a thread, one page at a time
+                    page_results = await asyncio.to_thread(next, pages, None)
+                    if page_results is None:
+                        break
+                    stats["found"] += len(page_results)
+                    unseen = filter_unseen(page_results, seen_index)
+                    stats["skipped"] += len(page_results) - len(unseen)
+                    if frontier is None:
+                        for result in unseen:
+                            await url_queue.put(result)
+                    else:
+                        await asyncio.to_thread(frontier.add, unseen, search_query, category)
+                        await claim_from_frontier(unseen)
+                if frontier is not None:
+                    await asyncio.to_thread(frontier.complete_search, search_query, category, max_pages)
+            if frontier is not None:
+                await claim_from_frontier()  # What a previous run left pending
+        except Exception as e:
+            logger.error(f"Search stage failed: {e}")
+        finally:
+            for _ in range(item_workers):
+                await url_queue.put(_END)
+
+    async def item_stage():
+        while True:
+            result = await url_queue.get()
+            if result is _END:
+                break
+            try:
+                if fast:
+                    item = await asyncio.to_thread(perform_card_scrapping, result, category, fetcher=item_fetcher)
+                else:
+                    item = await asyncio.to_thread(perform_item_page_scrapping, result['url'], category, fetcher=item_fetcher)
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error("Failed to scrape item %s: %s", result['url'], e)
+                if frontier is not None:
+                    await asyncio.to_thread(frontier.mark_failed, result['url'], str(e))
+                continue
+            stats["scraped"] += 1
+            await object_queue.put(item)
+
+    async def writer_stage():
+        while True:
+            item = await object_queue.get()
+            if item is _END:
+                break
+            if stats["time_to_first_document"] is None:
+                stats["time_to_first_document"] = time.monotonic() - started_at
+                logger.info(f"First document reached the writer after {stats['time_to_first_document']:.2f}s")
+            document = item.to_dict()
+            try:
+                if exporter is not None:
+                    await asyncio.to_thread(exporter.add, document)
+                # Only blocks when the batch is full and gets flushed
+                await asyncio.to_thread(bulk_writer.add, document)
+            except Exception as e:
+                logger.error(f"Failed to write batch ending with item {item.url}: {e}")
+                continue
+            stats["written"] += 1
+
+    writer = asyncio.create_task(writer_stage())
+    try:
+        await asyncio.gather(search_stage(), *(item_stage() for _ in range(item_workers)))
+    finally:
+        await object_queue.put(_END)
+        await writer
+        await asyncio.to_thread(bulk_writer.close)
+        stats["writer"] = bulk_writer.stats
+        if owns_pool:
+            driver_pool.close()
+
+    logger.info(f"Pipeline finished: {stats}")
+    return stats
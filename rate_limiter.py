@@ -0,0 +1,183 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from logging_config import set_up_logger
+from metrics import metrics_registry
+
+logger = set_up_logger(__name__)
+
+
+class _HostState:
+    def __init__(self, rate: float, concurrency: float):
+        self.rate = rate  # Tokens added per second
+        self.tokens = 1.0
+        self.refilled_at = time.monotonic()
+        self.concurrency = concurrency  # Fractional, only its integer part is enforced
+        self.in_flight = 0
+        self.successes = 0  # Since the last increase or block
+        self.consecutive_blocks = 0
+        self.backoff_until = 0.0
+
+
+class AdaptiveRateLimiter:
+    def __init__(
+            self,
+            *,
+            initial_rate: float = 2.0,
+            min_rate: float = 0.2,
+            max_rate: float = 20.0,
+            initial_concurrency: int = 4,
+            max_concurrency: int = 16,
+            increase_after: int = 10,
+            decrease_factor: float = 0.5,
+            base_backoff: float = 2.0,
+            max_backoff: float = 120.0,
+            ):
+        """
+        Per host token bucket with AIMD adaptive rate and concurrency
+
+        Every host gets its own bucket and in-flight limit. After increase_after successes
+        in a row the rate grows by one initial_rate step and the concurrency by one
+        (additive increase). A block cuts both by decrease_factor (multiplicative decrease)
+        and pauses the host for a jittered exponential backoff, so the limits settle near
+        what the site tolerates.
+
+        Args:
+            initial_rate: Requests per second per host at start
+            min_rate: Lowest rate a host is slowed down to
+            max_rate: Highest rate a host is sped up to
+            initial_concurrency: Requests in flight per host at start
+            max_concurrency: Highest number of requests in flight per host
+            increase_after: Successes in a row that trigger an additive increase
+            decrease_factor: Factor applied to the rate and concurrency on a block
+            base_backoff: Seconds of the first backoff, doubled on every consecutive block
+            max_backoff: Cap of the backoff before the jitter
+        """
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be between 0 and 1")
+        if not 0 < min_rate <= initial_rate <= max_rate:
+            raise ValueError("Rates must satisfy 0 < min_rate <= initial_rate <= max_rate")
+        if not 1 <= initial_concurrency <= max_concurrency:
+            raise ValueError("Concurrency must satisfy 1 <= initial_concurrency <= max_concurrency")
+
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase_after = increase_after
+        self.decrease_factor = decrease_factor
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._hosts = {}  # host -> _HostState
+        self._lock = threading.Condition()
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return urlsplit(url).hostname or ''
+
+    @contextmanager
+    def slot(self, url: str):
+        """Wait for the host of url to allow one more request, and hold the slot during the body"""
+        host = self.host_of(url)
+        with metrics_registry.timer("rate_limit_wait"):
+            self._acquire(host)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._hosts[host].in_flight -= 1
+                self._lock.notify_all()
+
+    def _acquire(self, host: str):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _HostState(self.initial_rate, self.initial_concurrency)
+
+            while True:
+                now = time.monotonic()
+                state.tokens = min(1.0, state.tokens + (now - state.refilled_at) * state.rate)
+                state.refilled_at = now
+
+                if now < state.backoff_until:
+                    wait = state.backoff_until - now
+                elif state.in_flight >= int(state.concurrency):
+                    wait = None  # Until a slot is released
+                elif state.tokens < 1:
+                    wait = (1 - state.tokens) / state.rate
+                else:
+                    state.tokens -= 1
+                    state.in_flight += 1
+                    return
+                self._lock.wait(wait)
+
+    def record_success(self, url: str):
+        """Report a page that came back fine"""
+        with self._lock:
+            state = self._hosts.get(self.host_of(url))
+            if state is None:
+                return
+            state.consecutive_blocks = 0
+            state.successes += 1
+            if state.successes >= self.increase_after:
+                state.successes = 0
+                state.rate = min(self.max_rate, state.rate + self.initial_rate)
+                state.concurrency = min(self.max_concurrency, state.concurrency + 1)
+                self._lock.notify_all()
+
+    def record_block(self, url: str, reason: str):
+        """Report a challenge, throttled or empty page: slow the host down and back off"""
+        host = self.host_of(url)
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                return
+            state.successes = 0
+            state.consecutive_blocks += 1
+            state.rate = max(self.min_rate, state.rate * self.decrease_factor)
+            state.concurrency = max(1.0, state.concurrency * self.decrease_factor)
+
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (state.consecutive_blocks - 1))
+            backoff = backoff / 2 + random.uniform(0, backoff / 2)  # Equal jitter, so workers do not retry in lockstep
+            state.backoff_until = max(state.backoff_until, time.monotonic() + backoff)
+            rate, concurrency = state.rate, int(state.concurrency)
+
+        metrics_registry.increment("rate_limit_blocks", host=host, reason=reason)
+        logger.warning(f"{reason} page from {host}, backing off {backoff:.1f}s at {rate:.2f} req/s and at most {concurrency} in flight")
+
+    def limits(self) -> dict:
+        """Current rate and concurrency of every host"""
+        with self._lock:
+            return {host: {"rate": state.rate, "concurrency": int(state.concurrency), "in_flight": state.in_flight} for host, state in self._hosts.items()}
+
+
+_default_rate_limiter = None
+_default_rate_limiter_lock = threading.Lock()
+
+
+def get_default_rate_limiter() -> AdaptiveRateLimiter:
+    """
+    Get the process wide rate limiter, creating it on first use. The starting rate and the
+    concurrency cap can be set with the RATE_LIMIT_PER_HOST and RATE_LIMIT_MAX_CONCURRENCY
+    environment variables.
+    Returns:
+        The shared AdaptiveRateLimiter.
+    """
+    global _default_rate_limiter
+    with _default_rate_limiter_lock:
+        if _default_rate_limiter is None:
+            initial_rate = float(os.getenv("RATE_LIMIT_PER_HOST", "2"))
+            max_concurrency = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", "16"))
+            _default_rate_limiter = AdaptiveRateLimiter(
+                initial_rate=initial_rate,
+                min_rate=min(0.2, initial_rate),
+                max_rate=max(20.0, initial_rate),
+                initial_concurrency=min(4, max_concurrency),
+                max_concurrency=max_concurrency,
+            )
+        return _default_rate_limiter
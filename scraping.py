@@ -1,25 +1,29 @@
-from enum import Enum
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
-from selenium.webdriver.common.keys import Keys
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote
+from selenium.common.exceptions import TimeoutException
 from logging_config import set_up_logger
 from mercado_libre import Mercado_Libre_Object
+from driver_pool import DriverPool, DriverProfile, WebDriverType, SEARCH_PROFILE, ITEM_PROFILE
+from fetcher import PageFetcher, get_default_fetcher
+from html_parsers import extract_search_results, extract_item_fields, extract_total_results
+from json_state import extract_item_state
+from metrics import metrics_registry
 
 logger = set_up_logger(__name__)
 
-class WebDriverType(Enum):
-    CHROME = 'chrome'
-    EDGE = 'edge'
-    FIREFOX = 'firefox'
-    SAFARI = 'safari'
-    INTERNET_EXPLORER = 'internet explorer'
+SEARCH_BASE_URL = os.getenv("MERCADO_LIBRE_SEARCH_URL", "https://listado.mercadolibre.com.co")
+SEARCH_READY_MARKER = 'ui-search-layout__item'
+SEARCH_PAGE_SIZE = 50  # Results per listing page, the step of the _Desde_ offset
+SEARCH_WORKERS = 4  # Search pages fetched concurrently once page 1 gave the result count
+MAX_LISTING_OFFSET = 2000  # Listings stop serving results past this offset
+ITEM_READY_MARKER = 'ui-pdp-container__col'
+# Fields a search card must show for fast mode to skip the item page
+CARD_REQUIRED_FIELDS = ("title", "price", "first_image_url")
+ITEM_EXTRACTION_MODE = os.getenv("ITEM_EXTRACTION_MODE", "auto")
 
-
-def perform_main_search_page_scrapping(search_query, driver_path='/usr/bin/chromedriver', web_driver_type=WebDriverType.CHROME, max_pages=10):    
+def perform_main_search_page_scrapping(search_query, driver_path='/usr/bin/chromedriver', web_driver_type=WebDriverType.CHROME, max_pages=10, driver_pool: DriverPool = None, fetcher: PageFetcher = None, search_base_url: str = None, search_workers: int = SEARCH_WORKERS, driver_profile: DriverProfile = SEARCH_PROFILE):
     """
     Perform a scrapping of the first 10 pages of the search query in mercado libre.
     Args:
@@ -27,185 +31,318 @@ def perform_main_search_page_scrapping(search_query, driver_path='/usr/bin/chrom
         driver_path: The path to the driver.
         web_driver_type: The type of web driver to use.
         max_pages: The maximum number of pages to scrape. If -1, it will scrape all the pages.
+        driver_pool: The pool to borrow the driver from. Defaults to the shared pool for driver_path.
+        fetcher: The fetcher used to download the pages. Defaults to HTTP with Selenium fallback.
+        search_base_url: The listing site to search in. Defaults to SEARCH_BASE_URL.
+        search_workers: Number of search pages fetched concurrently.
+        driver_profile: The launch options of the browser, when one is needed.
     Returns:
         A list of dictionaries with the title and url of the items.
     """
     logger.info(f"Starting MercadoLibre scrapping with query: {search_query}")
     logger.debug(f"Driver path: {driver_path}, Web driver type: {web_driver_type}, Max pages: {max_pages}")
-    
-    service = Service(driver_path)
-    if web_driver_type == WebDriverType.CHROME:
-        driver = webdriver.Chrome(service=service)
-    elif web_driver_type == WebDriverType.EDGE:
-        driver = webdriver.Edge(service=service)
-    elif web_driver_type == WebDriverType.FIREFOX:
-        driver = webdriver.Firefox(service=service)
-    elif web_driver_type == WebDriverType.SAFARI:
-        driver = webdriver.Safari(service=service)
-    elif web_driver_type == WebDriverType.INTERNET_EXPLORER:
-        driver = webdriver.Ie(service=service)
-    else:
-        raise ValueError(f"Web driver type {web_driver_type} not supported")
 
-    driver.get('https://www.mercadolibre.com.co/')  # Get the default page of mercado libre
-    logger.info("Navigated to MercadoLibre homepage")
+    results = []
+    for page_results in iter_search_pages(search_query, driver_path, web_driver_type, max_pages, driver_pool, fetcher, search_base_url, search_workers, driver_profile):
+        results.extend(page_results)
+
+    logger.info("Finished webscrapping all pages")
+    return results
+
 
-    # Espera hasta que el input esté presente
-    wait = WebDriverWait(driver, 10)
-    search_box = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="cb1-edit"]')))
+def iter_search_pages(search_query, driver_path='/usr/bin/chromedriver', web_driver_type=WebDriverType.CHROME, max_pages=10, driver_pool: DriverPool = None, fetcher: PageFetcher = None, search_base_url: str = None, search_workers: int = SEARCH_WORKERS, driver_profile: DriverProfile = SEARCH_PROFILE):
+    """
+    Lazily scrape the search result pages, yielding the items of each page as soon as it is parsed.
 
-    # Escribe en el campo de búsqueda
-    search_box.send_keys(search_query)
-    search_box.send_keys(Keys.ENTER)
-    logger.info(f"Search query '{search_query}' submitted")
+    Page 1 gives the total result count, from which the urls of the remaining pages are
+    planned and fetched concurrently. When the count is missing, the 'next' links are
+    followed one page at a time instead.
 
-    results = []
+    Takes the same arguments as perform_main_search_page_scrapping.
+    Returns:
+        A generator of lists of dictionaries with the title and url of the items, one list
+        per page, in the order the pages finish.
+    """
+    if fetcher is None:
+        fetcher = get_default_fetcher(driver_path, web_driver_type, driver_pool, driver_profile)
 
-    # Go through the first 10 pages
-    for page_num in range(0, max_pages):
+    first_page_url = build_search_url(search_query, search_base_url or SEARCH_BASE_URL)
+    logger.info(f"Processing page 1 of {max_pages}")
+    html = fetcher.fetch(first_page_url, SEARCH_READY_MARKER)
+    page_results, next_page_url = parse_search_page(html)
+    logger.debug(f"Found {len(page_results)} items on page 1")
+    yield page_results
+
+    total_results = extract_total_results(html)
+    if total_results is None:
+        logger.warning("Total result count not found, following the next page links")
+        yield from _follow_next_page_links(fetcher, next_page_url, max_pages)
+        return
+
+    page_urls = plan_search_page_urls(first_page_url, total_results, max_pages)
+    logger.info(f"{total_results} results, fetching {len(page_urls)} more pages with {search_workers} workers")
+    with ThreadPoolExecutor(max_workers=max(1, search_workers)) as executor:
+        futures = {executor.submit(fetcher.fetch, page_url, SEARCH_READY_MARKER): page_url for page_url in page_urls}
+        for future in as_completed(futures):
+            try:
+                page_results, _ = parse_search_page(future.result())
+            except Exception as e:
+                logger.error(f"Failed to scrape search page {futures[future]}: {e}")
+                continue
+            logger.debug(f"Found {len(page_results)} items on {futures[future]}")
+            yield page_results
+
+
+def _follow_next_page_links(fetcher: PageFetcher, page_url: str, max_pages: int):
+    page_num = 1
+    while page_url and (max_pages < 0 or page_num < max_pages):
         logger.info(f"Processing page {page_num + 1} of {max_pages}")
-        
-        # Espera a que carguen los resultados
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'li.ui-search-layout__item')))
-
-        # Parsear con BeautifulSoup
-        html = driver.page_source
-        soup = BeautifulSoup(html, 'html.parser')
-
-        # Selecciona todos los items
-        items = soup.select('li.ui-search-layout__item')
-        logger.debug(f"Found {len(items)} items on page {page_num + 1}")
-
-        for item in items:
-            # Selecciona el enlace del título con clase poly-component__title
-            link = item.select_one('a.poly-component__title')
-            if link:
-                titulo = link.text.strip()
-                href = link.get('href')
-                results.append({ "title": titulo, "url": href })
-                logger.info(f'Título: {titulo}')
-                logger.info(f'URL: {href}')
-
-        # Go to the next page
-        try:
-            logger.debug("Attempting to navigate to next page")
-            next_page_button = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="root-app"]/div/div[2]/section/div[6]/nav/ul/li[12]/a')))
-            driver.execute_script("arguments[0].click();", next_page_button)
-            logger.info(f"Successfully navigated to page {page_num + 2}")
-        except:
-            logger.warning("Next page button not found, stopping pagination")
-            break
-        
-    logger.info("Finished webscrapping all pages")
-    driver.quit()
-    return results
 
+        html = fetcher.fetch(page_url, SEARCH_READY_MARKER)
+        page_results, page_url = parse_search_page(html)
+        logger.debug(f"Found {len(page_results)} items on page {page_num + 1}")
+        page_num += 1
+        yield page_results
 
-def perform_item_page_scrapping(url: str, category: str, driver_path='/usr/bin/chromedriver', web_driver_type=WebDriverType.CHROME):
+        if page_url is None:
+            logger.warning("Next page link not found, stopping pagination")
+
+
+def plan_search_page_urls(first_page_url: str, total_results: int, max_pages: int = -1, page_size: int = SEARCH_PAGE_SIZE):
+    """
+    Build the urls of the search pages after the first one from the listing offset scheme.
+    Args:
+        first_page_url: The url of the first page of results.
+        total_results: The result count shown on the first page.
+        max_pages: The maximum number of pages, counting the first one. If -1, all of them.
+        page_size: The number of results per page.
+    Returns:
+        The list of urls of pages 2 onwards.
+    """
+    reachable_results = min(total_results, MAX_LISTING_OFFSET)
+    page_count = -(-reachable_results // page_size)  # Ceiling division
+    if max_pages >= 0:
+        page_count = min(page_count, max_pages)
+
+    return [f"{first_page_url}_Desde_{page * page_size + 1}_NoIndex_True" for page in range(1, page_count)]
+
+
+def build_search_url(search_query: str, search_base_url: str = SEARCH_BASE_URL) -> str:
+    """
+    Build the listing url of a search query.
+    Args:
+        search_query: The query to search for.
+        search_base_url: The listing site to search in.
+    Returns:
+        The url of the first page of results.
+    """
+    slug = "-".join(search_query.strip().lower().split())
+    return f"{search_base_url.rstrip('/')}/{quote(slug)}"
+
+
+def parse_search_page(html: str, parser_backend: str = None):
+    """
+    Parse a page of search results.
+    Args:
+        html: The html of the search results page.
+        parser_backend: The html parser backend to use. Defaults to the fastest available.
+    Returns:
+        A tuple with the list of dictionaries with the title and url of the items,
+        and the url of the next page or None if it is the last one.
+    """
+    with metrics_registry.timer("parse_search_page"):
+        results, next_page_url = extract_search_results(html, parser_backend)
+    for result in results:
+        logger.info('Título: %s', result["title"])
+        logger.info('URL: %s', result["url"])
+    return results, next_page_url
+
+
+def perform_item_page_scrapping(url: str, category: str, driver_path='/usr/bin/chromedriver', web_driver_type=WebDriverType.CHROME, driver_pool: DriverPool = None, fetcher: PageFetcher = None, driver_profile: DriverProfile = ITEM_PROFILE):
     """
     Perform a scrapping of the item page in mercado libre.
     Args:
         url: The url of the item page.
         driver_path: The path to the driver.
         web_driver_type: The type of web driver to use.
+        driver_pool: The pool to borrow the driver from. Defaults to the shared pool for driver_path.
+        fetcher: The fetcher used to download the page. Defaults to HTTP with Selenium fallback.
+        driver_profile: The launch options of the browser, when one is needed.
     Returns:
         A Mercado_Libre_Object with the item information.
     """
-    logger.info(f"Starting MercadoLibre item page scrapping with url: {url}")
-    logger.debug(f"Driver path: {driver_path}, Web driver type: {web_driver_type}")
-    
-    service = Service(driver_path)
-    if web_driver_type == WebDriverType.CHROME:
-        driver = webdriver.Chrome(service=service)
-    elif web_driver_type == WebDriverType.EDGE:
-        driver = webdriver.Edge(service=service)
-    elif web_driver_type == WebDriverType.FIREFOX:
-        driver = webdriver.Firefox(service=service)
-    elif web_driver_type == WebDriverType.SAFARI:
-        driver = webdriver.Safari(service=service)
-    elif web_driver_type == WebDriverType.INTERNET_EXPLORER:
-        driver = webdriver.Ie(service=service)
-    else:
-        raise ValueError(f"Web driver type {web_driver_type} not supported")
+    logger.info("Starting MercadoLibre item page scrapping with url: %s", url)
+    logger.debug("Driver path: %s, Web driver type: %s", driver_path, web_driver_type)
     
+    if fetcher is None:
+        fetcher = get_default_fetcher(driver_path, web_driver_type, driver_pool, driver_profile)
+
     try:
-        driver.get(url)
-        logger.info(f"Navigated to item page: {url}")
-        
-        # Wait for main container to load (single wait)
-        wait = WebDriverWait(driver, 10)
-        wait.until(EC.presence_of_element_located((By.CLASS_NAME, 'ui-pdp-container__col')))
-        
-        # Get page source once after page loads
-        html = driver.page_source
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Extract required data using BeautifulSoup
-        
-        # Title
-        title_elem = soup.find('h1', class_='ui-pdp-title')
-        title = title_elem.text.strip() if title_elem else None
-        logger.info(f"Title: {title}")
-        
-        # Price (current price) - convert to float
-        price_elem = soup.find('span', class_='andes-money-amount__fraction')
-        price_text = price_elem.text.strip() if price_elem else "0"
-        # Remove dots (thousand separators) and convert to float
-        price = float(price_text.replace('.', '').replace(',', '.')) if price_text else 0.0
-        logger.info(f"Price: {price}")
-        
-        # Currency
-        currency = _get_currency_from_url(url)
-        logger.info(f"Currency: {currency}")
-        
-        # Condition
-        subtitle_elem = soup.find('span', class_='ui-pdp-subtitle')
-        if subtitle_elem:
-            subtitle_text = subtitle_elem.text.strip()
-            condition = _extract_condition_from_text(subtitle_text)
-        else:
-            condition = "Unknown"
-        logger.info(f"Condition: {condition}")
-        
-        # Seller ID/Name
-        seller_name = None
-        seller_elem = soup.find('div', class_='ui-pdp-seller__header__title')
-        if seller_elem:
-            seller_button = seller_elem.find('button')
-            if seller_button:
-                seller_spans = seller_button.find_all('span')
-                seller_name = seller_spans[1].text.strip() if len(seller_spans) > 1 else None
-        logger.info(f"Seller NAME: {seller_name}")
-        
-        # First image URL
-        first_image_url = None
-        image_elem = soup.find('img', class_='ui-pdp-image ui-pdp-gallery__figure__image')
-        if image_elem:
-            first_image_url = image_elem.get('src') or image_elem.get('data-src')
-
-        logger.info(f"First image URL: {first_image_url}")
-        
-        # Create and return Mercado_Libre_Object
-        result = Mercado_Libre_Object(
-            title=title,
-            url=url,
-            price=price,
-            currency=currency,
-            condition=condition,
-            seller_name=seller_name,
-            first_image_url=first_image_url,
-            category=category,
-        )
-        
-        logger.info(f"Result object: {result.to_dict()}")
+        with metrics_registry.timer("item_total"):
+            html = fetcher.fetch(url, ITEM_READY_MARKER)
+            logger.info("Fetched item page: %s", url)
+            result = parse_item_page(html, url, category)
+        metrics_registry.increment("items_scraped")
         return result
-        
+    except TimeoutException as e:
+        metrics_registry.increment("items_timed_out")
+        logger.error("Error during scraping: %s", e)
+        raise
     except Exception as e:
-        logger.error(f"Error during scraping: {e}")
+        metrics_registry.increment("items_failed")
+        logger.error("Error during scraping: %s", e)
         raise
-    finally:
-        driver.quit()
-        logger.info("Driver closed")
+
+
+def perform_card_scrapping(result: dict, category: str, driver_path='/usr/bin/chromedriver', web_driver_type=WebDriverType.CHROME, driver_pool: DriverPool = None, fetcher: PageFetcher = None, driver_profile: DriverProfile = ITEM_PROFILE, required_fields=CARD_REQUIRED_FIELDS):
+    """
+    Build the item from its search result card, fetching the item page only when the card
+    lacks one of the required fields. The page then fills the fields the card did not show.
+    Args:
+        result: A search result, with the card fields of extract_search_results.
+        category: The category to classify the item in.
+        required_fields: The Mercado_Libre_Object fields the card must have to skip the page.
+        The other arguments are the ones of perform_item_page_scrapping, used when the page is fetched.
+    Returns:
+        A Mercado_Libre_Object with the item information.
+    """
+    item = build_item_from_card(result, category)
+    missing = [field for field in required_fields if getattr(item, field) is None]
+    if not missing:
+        metrics_registry.increment("items_from_cards")
+        metrics_registry.increment("items_scraped")
+        return item
+
+    logger.info("Card of %s lacks %s, fetching the item page", result['url'], missing)
+    metrics_registry.increment("card_enrichments")
+    page_item = perform_item_page_scrapping(result['url'], category, driver_path, web_driver_type, driver_pool, fetcher, driver_profile)
+    for field in ("title", "price", "currency", "condition", "seller_name", "first_image_url"):
+        if getattr(item, field) is None or field in item.card_fields:
+            setattr(item, field, getattr(page_item, field))
+    item.card_fields = ()
+    return item
+
+
+def build_item_from_card(result: dict, category: str) -> Mercado_Libre_Object:
+    """
+    Build an item from what its search result card shows.
+    Args:
+        result: A search result, with the card fields of extract_search_results.
+        category: The category to classify the item in.
+    Returns:
+        A Mercado_Libre_Object, with None in the fields the card does not show. Its
+        card_fields name the thumbnail, which only fills items stored for the first time.
+    """
+    seller_text = result.get("seller_text")
+    if seller_text and seller_text.lower().startswith("por "):
+        seller_text = seller_text[4:].strip()
+
+    return Mercado_Libre_Object(
+        title=result.get("title") or None,
+        url=result['url'],
+        price=_parse_price(result.get("price_text")),
+        currency=_get_currency_from_url(result['url']),
+        condition=_extract_condition_from_text(result["condition_text"]) if result.get("condition_text") else None,
+        seller_name=seller_text or None,
+        first_image_url=result.get("first_image_url"),
+        category=category,
+        card_fields=("first_image_url",) if result.get("first_image_url") else (),
+    )
+
+
+def parse_item_page(html: str, url: str, category: str, parser_backend: str = None, extraction_mode: str = None) -> Mercado_Libre_Object:
+    """
+    Parse the html of an item page.
+    Args:
+        html: The html of the item page.
+        url: The url of the item page.
+        category: The category to classify the item in.
+        parser_backend: The html parser backend to use. Defaults to the fastest available.
+        extraction_mode: "auto" reads the embedded JSON state and walks the DOM only for what
+            it lacks, "dom" always walks the DOM. Defaults to ITEM_EXTRACTION_MODE.
+    Returns:
+        A Mercado_Libre_Object with the item information.
+    """
+    extraction_mode = extraction_mode or ITEM_EXTRACTION_MODE
+    if extraction_mode not in ("auto", "dom"):
+        raise ValueError(f"Extraction mode {extraction_mode} not supported")
+
+    with metrics_registry.timer("parse_item_page"):
+        values = extract_item_state(html) if extraction_mode == "auto" else None
+        if values is None:
+            extraction_path = "dom"
+            values = _extract_item_values_from_dom(html, url, parser_backend)
+        elif any(value is None for value in values.values()):
+            extraction_path = "json+dom"
+            dom_values = _extract_item_values_from_dom(html, url, parser_backend)
+            values = {field: dom_values[field] if value is None else value for field, value in values.items()}
+        else:
+            extraction_path = "json"
+    metrics_registry.increment("item_extraction", path=extraction_path)
+    logger.info("Extraction path: %s", extraction_path)
+
+    logger.info("Title: %s", values['title'])
+    logger.info("Price: %s", values['price'])
+    logger.info("Currency: %s", values['currency'])
+    logger.info("Condition: %s", values['condition'])
+    logger.info("Seller NAME: %s", values['seller_name'])
+    logger.info("First image URL: %s", values['first_image_url'])
+    
+    # Create and return Mercado_Libre_Object
+    result = Mercado_Libre_Object(
+        url=url,
+        category=category,
+        **values,
+    )
+    
+    if logger.isEnabledFor(logging.INFO):  # Skip building the dict when the record would be dropped
+        logger.info("Result object: %s", result.to_dict())
+    return result
+
+
+def _extract_item_values_from_dom(html: str, url: str, parser_backend: str = None):
+    """
+    Extract the item fields by walking the DOM.
+    Args:
+        html: The html of the item page.
+        url: The url of the item page.
+        parser_backend: The html parser backend to use.
+    Returns:
+        A dictionary with the title, price, currency, condition, seller_name and first_image_url.
+    """
+    fields = extract_item_fields(html, parser_backend)
+
+    # Price (current price) - convert to float
+    price = _parse_price(fields["price_text"] or "0")
+    
+    # Condition
+    if fields["subtitle_text"] is not None:
+        condition = _extract_condition_from_text(fields["subtitle_text"])
+    else:
+        condition = "Unknown"
+
+    return {
+        "title": fields["title"],
+        "price": price,
+        "currency": _get_currency_from_url(url),
+        "condition": condition,
+        "seller_name": fields["seller_name"],
+        "first_image_url": fields["first_image_url"],
+    }
+
+
+def _parse_price(price_text):
+    """
+    Convert a displayed price ("25.900" or "25.900,50") to a float.
+    Args:
+        price_text: The text of the price.
+    Returns:
+        The price, or None if there is no text.
+    """
+    if not price_text:
+        return None
+    # Remove dots (thousand separators) and convert to float
+    return float(price_text.replace('.', '').replace(',', '.'))
 
 
 def _get_currency_from_url(url):
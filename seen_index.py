@@ -0,0 +1,135 @@
+import hashlib
+import math
+from datetime import datetime, timedelta, timezone
+from logging_config import set_up_logger
+from mongo_manager import MongoManager
+from url_utils import canonicalize_url, extract_item_id
+
+logger = set_up_logger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, expected_items: int, false_positive_rate: float = 0.001):
+        """
+        Fixed size probabilistic set: no false negatives, false positives at about false_positive_rate
+
+        Args:
+            expected_items: Number of items the filter is sized for
+            false_positive_rate: Target false positive rate once expected_items were added
+        """
+        expected_items = max(expected_items, 1)
+        self.capacity = expected_items
+        self.size = max(8, int(-expected_items * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / expected_items * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        # Double hashing: two 64 bit halves of one digest give all the positions
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SeenIndex:
+    def __init__(self, *, expected_items: int = 1_000_000, use_bloom_filter: bool = True, false_positive_rate: float = 0.001):
+        """
+        In memory set of the items scraped recently enough to be skipped
+
+        Args:
+            expected_items: Capacity the Bloom filter is sized for, on top of the items
+                load_from_mongo finds in the collection
+            use_bloom_filter: Use a compact Bloom filter instead of an exact set. A false
+                positive skips an item that was not scraped, at about false_positive_rate
+            false_positive_rate: Target false positive rate of the Bloom filter
+        """
+        self.expected_items = expected_items
+        self.false_positive_rate = false_positive_rate
+        self._keys = BloomFilter(expected_items, false_positive_rate) if use_bloom_filter else set()
+        self.count = 0
+        self._warned_over_capacity = False
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        """The item id of the url, or its canonical form when it has none"""
+        return extract_item_id(url) or canonicalize_url(url)
+
+    def add(self, url: str):
+        self._keys.add(self.key_for(url))
+        self.count += 1
+        self._check_capacity()
+
+    def _check_capacity(self):
+        if isinstance(self._keys, BloomFilter) and self.count > self._keys.capacity and not self._warned_over_capacity:
+            self._warned_over_capacity = True
+            logger.warning(
+                f"Seen index holds {self.count} items, past the {self._keys.capacity} its Bloom filter was sized for: "
+                f"new items are skipped as seen well above the {self.false_positive_rate} false positive rate"
+            )
+
+    def __contains__(self, url: str) -> bool:
+        return self.key_for(url) in self._keys
+
+    def load_from_mongo(self, mongo_manager: MongoManager, freshness_ttl: timedelta, collection_name: str = "Items") -> int:
+        """
+        Bulk load the items written within freshness_ttl. An empty Bloom filter is first
+        resized for the estimated size of the collection plus expected_items.
+        Args:
+            mongo_manager: The manager to read from.
+            freshness_ttl: How recent a write must be for the item to be skipped.
+            collection_name: Name of the collection.
+        Returns:
+            The number of items loaded.
+        """
+        cutoff = datetime.now(timezone.utc) - freshness_ttl
+        query = {"$or": [{"last_seen": {"$gte": cutoff}}, {"updated_at": {"$gte": cutoff}}, {"created_at": {"$gte": cutoff}}]}
+        logger.info(f"Loading items scraped since {cutoff.isoformat()} from collection: {collection_name}")
+
+        if isinstance(self._keys, BloomFilter) and self.count == 0:
+            stored = mongo_manager.db[collection_name].estimated_document_count()
+            if stored + self.expected_items > self._keys.capacity:
+                self._keys = BloomFilter(stored + self.expected_items, self.false_positive_rate)
+                logger.info(f"Sized the Bloom filter for {self._keys.capacity} items ({self._keys.size / 8 / 1024 ** 2:.1f} MB)")
+
+        loaded = 0
+        documents = mongo_manager.iter_documents(collection_name, query, projection={"item_id": 1, "url": 1, "_id": 0}, batch_size=10_000)
+        for document in documents:
+            key = document.get("item_id") or (document.get("url") and self.key_for(document["url"]))
+            if key:
+                self._keys.add(key)
+                loaded += 1
+        self.count += loaded
+        self._check_capacity()
+
+        logger.info(f"Loaded {loaded} recently scraped items")
+        return loaded
+
+
+def filter_unseen(results, seen_index: SeenIndex):
+    """
+    Canonicalize the urls of the search results and drop the ones already seen,
+    including repeats within the same results.
+    Args:
+        results: The list of dictionaries with the title and url of the items.
+        seen_index: The index of the already scraped items, updated with the kept results.
+    Returns:
+        The list of results left to scrape, with canonical urls.
+    """
+    unseen = []
+    for result in results:
+        url = canonicalize_url(result['url'])
+        if url in seen_index:
+            continue
+        seen_index.add(url)
+        unseen.append({**result, "url": url})
+
+    logger.info(f"Skipping {len(results) - len(unseen)} already scraped results")
+    return unseen
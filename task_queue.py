@@ -0,0 +1,143 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne, IndexModel, ASCENDING, ReturnDocument
+from logging_config import set_up_logger
+from mongo_manager import MongoManager
+from seen_index import SeenIndex
+
+logger = set_up_logger(__name__)
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class MongoTaskQueue:
+    def __init__(self, mongo_manager: MongoManager, *, collection_name: str = "Tasks", lease_seconds: float = 300, max_attempts: int = 3, sweep_interval: float = 30):
+        """
+        Queue of item urls shared by scraper processes on any number of nodes
+
+        Every task is one item, keyed like the seen index so an item found by several
+        queries is queued once with all their categories. A worker leases a task with an
+        atomic find-and-modify, and the lease expires after lease_seconds, so the tasks of a
+        crashed worker are handed out again.
+
+        Args:
+            mongo_manager: The manager whose database holds the queue
+            collection_name: Name of the queue collection
+            lease_seconds: How long a worker owns a task before it can be leased again
+            max_attempts: Number of leases of a task before it stays failed
+            sweep_interval: Minimum seconds between two sweeps of this queue for expired leases
+                without attempts left, which are marked failed
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.mongo_manager = mongo_manager
+        self.collection_name = collection_name
+        self.collection = mongo_manager.db[collection_name]
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self._swept_at = None
+        self._sweep_lock = threading.Lock()
+
+    def ensure_indexes(self):
+        self.collection.create_indexes([
+            IndexModel([("state", ASCENDING), ("created_at", ASCENDING)], name="state_created_at"),
+            IndexModel([("state", ASCENDING), ("lease_until", ASCENDING)], name="state_lease_until"),
+            IndexModel([("url", ASCENDING)], name="url"),
+        ])
+
+    def enqueue(self, results, category: str) -> int:
+        """
+        Queue search results, adding the category to the ones already queued and queueing
+        again the ones a previous crawl finished.
+        Args:
+            results: The list of dictionaries with the title and url of the items, and
+                their search card fields if any.
+            category: The category to tag the items with.
+        Returns:
+            The number of new tasks.
+        """
+        if not results:
+            return 0
+        now = datetime.now(timezone.utc)
+        operations = []
+        for result in results:
+            key = SeenIndex.key_for(result['url'])
+            # Finished tasks of a previous crawl are queued again, the seen index already dropped the fresh ones
+            operations.append(UpdateOne(
+                {"_id": key, "state": {"$in": [DONE, FAILED]}},
+                {"$set": {"result": result, "state": PENDING, "attempts": 0, "created_at": now}, "$unset": {"last_error": ""}},
+            ))
+            operations.append(UpdateOne(
+                {"_id": key},
+                {
+                    "$setOnInsert": {"url": result['url'], "result": result, "state": PENDING, "attempts": 0, "created_at": now},
+                    "$addToSet": {"categories": category},
+                },
+                upsert=True,
+            ))
+        result = self.mongo_manager.bulk_write(operations, self.collection_name, ordered=False)
+        logger.info(f"Queued {result.upserted_count} new tasks for category {category}")
+        return result.upserted_count
+
+    def lease(self, worker_id: str):
+        """
+        Take the oldest pending task, or one whose lease expired.
+        Args:
+            worker_id: Identifies the worker in the task while it holds the lease.
+        Returns:
+            The task document, or None if there is nothing to do.
+        """
+        now = datetime.now(timezone.utc)
+        self._sweep_expired(now)
+        return self.collection.find_one_and_update(
+            {
+                "$or": [{"state": PENDING}, {"state": LEASED, "lease_until": {"$lt": now}}],
+                "attempts": {"$lt": self.max_attempts},
+            },
+            {
+                "$set": {"state": LEASED, "worker": worker_id, "lease_until": now + timedelta(seconds=self.lease_seconds)},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _sweep_expired(self, now: datetime):
+        # Expired leases without attempts left would otherwise stay leased forever. The sweep
+        # scans the whole queue, so the idle polls of every thread do not each run one
+        with self._sweep_lock:
+            if self._swept_at is not None and time.monotonic() - self._swept_at < self.sweep_interval:
+                return
+            self._swept_at = time.monotonic()
+        self.collection.update_many(
+            {"state": LEASED, "lease_until": {"$lt": now}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"state": FAILED, "last_error": "Lease expired on the last attempt"}, "$unset": {"lease_until": ""}},
+        )
+
+    def complete(self, urls, worker_id: str) -> int:
+        """Mark the tasks of urls done, unless their lease was lost to another worker"""
+        result = self.collection.update_many(
+            {"url": {"$in": list(urls)}, "state": LEASED, "worker": worker_id},
+            {"$set": {"state": DONE, "finished_at": datetime.now(timezone.utc)}, "$unset": {"lease_until": ""}},
+        )
+        return result.modified_count
+
+    def fail(self, task: dict, worker_id: str, error: str):
+        """Give the task back to the queue, or mark it failed once it used its attempts"""
+        state = FAILED if task["attempts"] >= self.max_attempts else PENDING
+        self.collection.update_one(
+            {"_id": task["_id"], "state": LEASED, "worker": worker_id},
+            {"$set": {"state": state, "last_error": error}, "$unset": {"lease_until": ""}},
+        )
+
+    def counts(self) -> dict:
+        """Number of tasks in each state"""
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        for row in self.collection.aggregate([{"$group": {"_id": "$state", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return counts
@@ -0,0 +1,41 @@
+import threading
+import time
+from contextlib import ExitStack
+
+import driver_pool
+from driver_pool import DriverPool, SEARCH_PROFILE, ITEM_PROFILE
+
+
+class FakeDriver:
+    def quit(self):
+        pass
+
+
+def test_release_wakes_the_waiter_of_the_freed_profile(monkeypatch):
+    monkeypatch.setattr(driver_pool, "create_driver", lambda *args: FakeDriver())
+    monkeypatch.setattr(DriverPool, "_is_healthy", staticmethod(lambda pooled: True))
+    pool = DriverPool(max_drivers_per_type=1)
+    got_search_driver = threading.Event()
+
+    def borrow(profile, event=None):
+        with pool.checkout(profile=profile):
+            if event is not None:
+                event.set()
+
+    with ExitStack() as held:
+        held.enter_context(pool.checkout(profile=ITEM_PROFILE))
+        search_checkout = pool.checkout(profile=SEARCH_PROFILE)
+        search_checkout.__enter__()
+
+        # The item waiter queues first, so a single notify would wake it instead of the search one
+        item_waiter = threading.Thread(target=borrow, args=(ITEM_PROFILE,), daemon=True)
+        item_waiter.start()
+        time.sleep(0.1)
+        search_waiter = threading.Thread(target=borrow, args=(SEARCH_PROFILE, got_search_driver), daemon=True)
+        search_waiter.start()
+        time.sleep(0.1)
+
+        search_checkout.__exit__(None, None, None)
+        assert got_search_driver.wait(timeout=2)
+    item_waiter.join(timeout=2)
+    pool.close()
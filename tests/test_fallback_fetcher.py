@@ -0,0 +1,73 @@
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+
+from fetcher import PageFetcher, FallbackFetcher, SeleniumFetcher, BlockedPageError, PageNotFoundError, detect_page_problem
+
+
+class RaisingFetcher(PageFetcher):
+    def __init__(self, error):
+        self.error = error
+
+    def fetch(self, url, ready_marker=None):
+        raise self.error
+
+
+class StaticFetcher(PageFetcher):
+    def __init__(self, html):
+        self.html = html
+        self.urls = []
+
+    def fetch(self, url, ready_marker=None):
+        self.urls.append(url)
+        return self.html
+
+
+# A page rendered by JS, whose scripts mention a captcha widget, misses the ready marker over HTTP
+JS_PAGE = "<html><head><script>window.captchaConfig = {};</script></head><body>" + "<div></div>" * 100 + "</body></html>"
+
+
+def test_markup_block_falls_back_to_browser():
+    problem = detect_page_problem(JS_PAGE)
+    assert problem is BlockedPageError
+
+    browser = StaticFetcher("<div class='ui-pdp-title'>Casco</div>")
+    fetcher = FallbackFetcher(RaisingFetcher(problem("Marker not found")), browser)
+
+    assert "Casco" in fetcher.fetch("https://articulo.mercadolibre.com.co/MCO-1420018877-casco-_JM", "ui-pdp-title")
+    assert browser.urls == ["https://articulo.mercadolibre.com.co/MCO-1420018877-casco-_JM"]
+
+
+@pytest.mark.parametrize("error", [BlockedPageError("answered 429", 429), PageNotFoundError("answered 404", 404)])
+def test_status_errors_skip_the_browser(error):
+    browser = StaticFetcher("")
+    fetcher = FallbackFetcher(RaisingFetcher(error), browser)
+
+    with pytest.raises(type(error)):
+        fetcher.fetch("https://articulo.mercadolibre.com.co/MCO-1420018877-casco-_JM", "ui-pdp-title")
+    assert browser.urls == []
+
+
+class RenderingDriver:
+    """Stands in for a web driver on a loaded page whose ready marker has not rendered yet"""
+
+    def __init__(self, page_source, visible_text):
+        self.page_source = page_source
+        self.visible_text = visible_text
+
+    def find_element(self, by, value):
+        raise NoSuchElementException(value)
+
+    def execute_script(self, script):
+        return "complete" if "readyState" in script else self.visible_text
+
+
+def test_browser_keeps_waiting_when_only_scripts_mention_a_captcha():
+    check = SeleniumFetcher._ready_or_failed("ui-pdp-title")
+
+    assert check(RenderingDriver(JS_PAGE, "")) is False
+
+
+def test_browser_stops_on_a_visible_challenge():
+    check = SeleniumFetcher._ready_or_failed("ui-pdp-title")
+
+    assert check(RenderingDriver(JS_PAGE, "Resuelve el captcha para continuar")) is BlockedPageError
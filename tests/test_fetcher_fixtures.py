@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+import pytest
+
+from fetcher import HttpFetcher, PageNotFoundError
+from scraping import perform_main_search_page_scrapping, perform_item_page_scrapping
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures")
+
+
+def _fixture_paths():
+    """The fixture pages of the manifest, by the path of the url they stand in for"""
+    with open(os.path.join(FIXTURES_DIR, "manifest.json"), encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    return {urlsplit(page["url"]).path: page["file"] for page in manifest["search_pages"] + manifest["item_pages"]}
+
+
+@pytest.fixture(scope="module")
+def stand_in_server():
+    """Local HTTP stand-in for the listing and item sites, serving the benchmark fixtures"""
+    paths = _fixture_paths()
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            file_name = paths.get(urlsplit(self.path).path)
+            if file_name is None:
+                self.send_error(404)
+                return
+            with open(os.path.join(FIXTURES_DIR, file_name), "rb") as fixture_file:
+                body = fixture_file.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = HttpFetcher(timeout=5)
+    yield fetcher
+    fetcher.close()
+
+
+def _local(url: str, server_url: str) -> str:
+    # The fixture search page links to the real item site, the stand-in serves it under the same path
+    return server_url + urlsplit(url).path
+
+
+def test_search_page_from_stand_in(stand_in_server, fetcher):
+    results = perform_main_search_page_scrapping("moto", max_pages=1, fetcher=fetcher, search_base_url=stand_in_server)
+
+    assert len(results) == 6
+    assert results[0]["title"] == "Pasamontañas Moto Multiuso 6 En 1 Balaclava Térmico Ciclismo"
+    assert results[0]["price_text"] == "25.900"
+    assert all(urlsplit(result["url"]).netloc == "articulo.mercadolibre.com.co" for result in results)
+
+
+def test_item_pages_from_stand_in(stand_in_server, fetcher):
+    results = perform_main_search_page_scrapping("moto", max_pages=1, fetcher=fetcher, search_base_url=stand_in_server)
+    items = {}
+    for result in results:
+        url = _local(result["url"], stand_in_server)
+        try:
+            item = perform_item_page_scrapping(url, "Motos", fetcher=fetcher)
+        except PageNotFoundError:
+            continue  # Only two of the six items have a saved page
+        items[item.item_id] = item
+
+    assert sorted(items) == ["MCO-1420018877", "MCO-1553683955"]
+
+    new_item = items["MCO-1553683955"]
+    assert new_item.title == "Pasamontañas Moto Multiuso 6 En 1 Balaclava Térmico Ciclismo"
+    assert new_item.price == 25900.0
+    assert new_item.currency == "COP"
+    assert new_item.condition == "Nuevo"
+    assert new_item.seller_name == "TIENDAMOTOCOL"
+    assert new_item.first_image_url == "https://http2.mlstatic.com/D_NQ_NP_812345-MCO70000000001_072023-O.webp"
+    assert new_item.categories == ("Motos",)
+
+    used_item = items["MCO-1420018877"]
+    assert used_item.price == 189000.0
+    assert used_item.condition == "Usado"
+    assert used_item.seller_name == "MOTOSYREPUESTOS"
+
+
+def test_missing_item_page_is_not_found(stand_in_server, fetcher):
+    with pytest.raises(PageNotFoundError):
+        perform_item_page_scrapping(stand_in_server + "/MCO-9999999999-no-existe-_JM", "Motos", fetcher=fetcher)
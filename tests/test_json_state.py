@@ -0,0 +1,63 @@
+import json
+import os
+
+import pytest
+
+import scraping
+from json_state import extract_item_state
+from scraping import parse_item_page
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures", "item_page_new.html")
+URL = "https://articulo.mercadolibre.com.co/MCO-1553683955-pasamontanas-moto-multiuso-6-en-1-balaclava-termico-ciclismo-_JM"
+
+
+@pytest.fixture(scope="module")
+def html():
+    with open(FIXTURE, encoding="utf-8") as page:
+        return page.read()
+
+
+@pytest.mark.parametrize("price", ['"Consultar"', '"25.900"', 'null'])
+def test_malformed_json_ld_price_is_read_from_the_dom(html, price):
+    item = parse_item_page(html.replace('"price":25900', f'"price":{price}'), URL, "Motos", extraction_mode="auto")
+
+    assert item.price == 25900.0
+    assert item.title == "Pasamontañas Moto Multiuso 6 En 1 Balaclava Térmico Ciclismo"
+
+
+STATE_ONLY_PAGE = """<html><head><script>window.__PRELOADED_STATE__ = %s;</script></head>
+<body><h1 class="ui-pdp-title">Casco del DOM</h1>
+<div class="ui-pdp-seller__header__title"><button><span>Vendido por</span><span>DOM_SELLER</span></button></div></body></html>"""
+
+
+def _state_page(components, **state):
+    return STATE_ONLY_PAGE % json.dumps({"initialState": {"components": components}, **state})
+
+
+ITEM_COMPONENTS = {
+    "header": {"title": "Casco Integral Certificado", "subtitle": "Usado  |  12 vendidos"},
+    "price": {"price": {"value": 189000, "currency_id": "COP"}},
+    "gallery": {"pictures": [{"url": "https://http2.mlstatic.com/D_NQ_NP_1-O.webp"}]},
+    "seller": {"name": "REAL_SELLER"},
+}
+
+
+def test_state_only_page_is_read_without_the_dom(monkeypatch):
+    monkeypatch.setattr(scraping, "_extract_item_values_from_dom", lambda *args: pytest.fail("the DOM was parsed"))
+    html = _state_page(ITEM_COMPONENTS, recommendations=[{"seller": {"name": "OTHER"}, "price": {"value": 1}}])
+
+    item = parse_item_page(html, URL, "Motos", extraction_mode="auto")
+
+    assert item.title == "Casco Integral Certificado"
+    assert item.price == 189000.0
+    assert item.currency == "COP"
+    assert item.condition == "Usado"
+    assert item.seller_name == "REAL_SELLER"
+    assert item.first_image_url == "https://http2.mlstatic.com/D_NQ_NP_1-O.webp"
+
+
+def test_ambiguous_state_seller_is_read_from_the_dom():
+    components = {**ITEM_COMPONENTS, "seller_info": {"name": "OTHER"}}
+
+    assert extract_item_state(_state_page(components))["seller_name"] is None
+    assert parse_item_page(_state_page(components), URL, "Motos", extraction_mode="auto").seller_name == "DOM_SELLER"
@@ -0,0 +1,37 @@
+import logging
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+from logging_config import _get_queue_handler
+
+FORMAT = "%(levelname)s %(message)s"
+
+
+def _fork_test_logger():
+    logger = logging.getLogger("async_fork_test")
+    logger.propagate = False  # pytest puts its capture handlers on the root logger
+    if not logger.handlers:
+        logger.addHandler(_get_queue_handler("async_fork_test.log", "a", FORMAT, False))
+    return logger
+
+
+def _log_from_child(message):
+    _fork_test_logger().error(message)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs fork")
+def test_async_records_of_forked_children_are_written(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("logs")
+    _fork_test_logger().error("from the parent")
+
+    with multiprocessing.get_context("fork").Pool(2) as pool:
+        pool.map(_log_from_child, ["from child 1", "from child 2"])
+
+    with open(os.path.join("logs", "async_fork_test.log"), encoding="utf-8") as log_file:
+        lines = log_file.read()
+    assert "from child 1" in lines
+    assert "from child 2" in lines
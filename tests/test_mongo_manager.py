@@ -0,0 +1,89 @@
+import mongomock
+import pytest
+
+from mongo_manager import MongoManager, BulkWriter
+
+URL = "https://articulo.mercadolibre.com.co/MCO-1420018877-casco-integral-certificado-moto-abatible-_JM"
+
+
+@pytest.fixture
+def mongo_manager():
+    return MongoManager(client=mongomock.MongoClient(), database_name="test")
+
+
+def _document(**fields):
+    return {
+        "item_id": "MCO-1420018877",
+        "title": "Casco Integral Certificado",
+        "url": URL,
+        "price": 189000.0,
+        "currency": "COP",
+        "condition": "Usado",
+        "seller_name": "MOTOSYREPUESTOS",
+        "first_image_url": "https://http2.mlstatic.com/D_NQ_NP_1-O.webp",
+        "category": "Motos",
+        "categories": ["Motos"],
+        **fields,
+    }
+
+
+def _prices(mongo_manager):
+    return [point["price"] for bucket in mongo_manager.db["PriceHistory"].find() for point in bucket["prices"]]
+
+
+def test_new_unchanged_and_changed_documents(mongo_manager):
+    _, counts = mongo_manager.write_changes([_document()])
+    assert counts["new"] == 1
+
+    _, counts = mongo_manager.write_changes([_document()])
+    assert counts["unchanged"] == 1
+
+    _, counts = mongo_manager.write_changes([_document(price=175000.0, categories=["Cascos"])])
+    assert counts["changed"] == 1
+
+    stored = mongo_manager.db["Items"].find_one({"item_id": "MCO-1420018877"})
+    assert stored["price"] == 175000.0
+    assert sorted(stored["categories"]) == ["Cascos", "Motos"]
+    assert _prices(mongo_manager) == [189000.0, 175000.0]
+
+
+def test_item_written_before_incremental_mode_gets_its_first_price_point(mongo_manager):
+    with BulkWriter(mongo_manager, flush_interval=0) as bulk_writer:
+        bulk_writer.add(_document(price=2.0))
+
+    for price in (2.0, 2.0, 3.0):
+        mongo_manager.write_changes([_document(price=price)])
+
+    assert _prices(mongo_manager) == [2.0, 3.0]
+
+
+def test_card_document_keeps_the_item_page_fields(mongo_manager):
+    mongo_manager.write_changes([_document()])
+    card = _document(condition=None, seller_name=None, first_image_url="https://http2.mlstatic.com/D_Q_NP_1-F.webp", card_fields=["first_image_url"])
+
+    _, counts = mongo_manager.write_changes([card])
+    assert counts["unchanged"] == 1
+
+    _, counts = mongo_manager.write_changes([{**card, "price": 175000.0}])
+    assert counts["changed"] == 1
+    stored = mongo_manager.db["Items"].find_one({"item_id": "MCO-1420018877"})
+    assert stored["price"] == 175000.0
+    assert stored["condition"] == "Usado"
+    assert stored["seller_name"] == "MOTOSYREPUESTOS"
+    assert stored["first_image_url"] == "https://http2.mlstatic.com/D_NQ_NP_1-O.webp"
+    assert "card_fields" not in stored
+
+    # Back to a full run with the same values: the hash of the merged card write matches
+    _, counts = mongo_manager.write_changes([_document(price=175000.0)])
+    assert counts["unchanged"] == 1
+
+
+def test_new_card_document_stores_the_thumbnail(mongo_manager):
+    card = _document(condition=None, seller_name=None, first_image_url="https://http2.mlstatic.com/D_Q_NP_1-F.webp", card_fields=["first_image_url"])
+
+    _, counts = mongo_manager.write_changes([card])
+
+    assert counts["new"] == 1
+    stored = mongo_manager.db["Items"].find_one({"item_id": "MCO-1420018877"})
+    assert stored["first_image_url"] == "https://http2.mlstatic.com/D_Q_NP_1-F.webp"
+    assert "seller_name" not in stored
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+
+from mongo_manager import MongoManager
+from task_queue import MongoTaskQueue, PENDING, LEASED, DONE, FAILED
+
+URLS = [f"https://articulo.mercadolibre.com.co/MCO-{1000000 + number}-item-_JM" for number in range(4)]
+
+
+@pytest.fixture
+def mongo_manager():
+    return MongoManager(client=mongomock.MongoClient(), database_name="test")
+
+
+def _queue(mongo_manager, **kwargs):
+    task_queue = MongoTaskQueue(mongo_manager, **kwargs)
+    task_queue.enqueue([{"title": f"Item {index}", "url": url} for index, url in enumerate(URLS)], "Motos")
+    return task_queue
+
+
+def _expire_leases(task_queue):
+    task_queue.collection.update_many({"state": LEASED}, {"$set": {"lease_until": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+
+
+def test_workers_lease_disjoint_tasks(mongo_manager):
+    task_queue = _queue(mongo_manager)
+    # Each worker process builds its own queue over the shared collection
+    workers = [(MongoTaskQueue(mongo_manager), "worker-0"), (MongoTaskQueue(mongo_manager), "worker-1")]
+
+    leased = []
+    while True:
+        worker_queue, worker_id = workers[len(leased) % 2]
+        task = worker_queue.lease(worker_id)
+        if task is None:
+            break
+        leased.append(task)
+
+    assert sorted(task["url"] for task in leased) == sorted(URLS)
+    assert {task["worker"] for task in leased} == {"worker-0", "worker-1"}
+    assert task_queue.counts() == {PENDING: 0, LEASED: 4, DONE: 0, FAILED: 0}
+
+
+def test_expired_lease_is_leased_again(mongo_manager):
+    task_queue = _queue(mongo_manager)
+    for _ in URLS:
+        task_queue.lease("crashed")
+    assert task_queue.lease("worker") is None
+
+    _expire_leases(task_queue)
+    task = task_queue.lease("worker")
+
+    assert task is not None
+    assert task["worker"] == "worker"
+    assert task["attempts"] == 2
+
+
+def test_stale_owner_cannot_complete(mongo_manager):
+    task_queue = _queue(mongo_manager)
+    task = task_queue.lease("slow")
+    _expire_leases(task_queue)
+    taken_over = task_queue.lease("worker")
+    assert taken_over["_id"] == task["_id"]
+
+    assert task_queue.complete([task["url"]], "slow") == 0
+    assert task_queue.collection.find_one({"_id": task["_id"]})["state"] == LEASED
+
+    assert task_queue.complete([task["url"]], "worker") == 1
+    assert task_queue.collection.find_one({"_id": task["_id"]})["state"] == DONE
+
+
+def test_task_fails_after_max_attempts(mongo_manager):
+    task_queue = _queue(mongo_manager, max_attempts=2)
+    url = URLS[0]
+
+    task = task_queue.lease("worker")
+    assert task["url"] == url
+    task_queue.fail(task, "worker", "timeout")
+    assert task_queue.collection.find_one({"_id": task["_id"]})["state"] == PENDING
+
+    task = task_queue.lease("worker")
+    assert task["url"] == url
+    task_queue.fail(task, "worker", "timeout")
+    stored = task_queue.collection.find_one({"_id": task["_id"]})
+    assert stored["state"] == FAILED
+    assert stored["last_error"] == "timeout"
+
+
+def test_expired_last_attempt_ends_failed(mongo_manager):
+    task_queue = _queue(mongo_manager, max_attempts=1, sweep_interval=0)
+    task = task_queue.lease("crashed")
+    _expire_leases(task_queue)
+
+    leased = [task_queue.lease("worker") for _ in range(len(URLS))]
+
+    assert task["_id"] not in {other["_id"] for other in leased if other is not None}
+    assert task_queue.collection.find_one({"_id": task["_id"]})["state"] == FAILED
+
+
+def test_expired_lease_sweep_is_throttled(mongo_manager):
+    task_queue = _queue(mongo_manager, max_attempts=1, sweep_interval=3600)
+    for _ in URLS:
+        task_queue.lease("crashed")
+    _expire_leases(task_queue)
+
+    # The first lease already swept, the expired leases wait for the next sweep
+    assert task_queue.lease("worker") is None
+    assert task_queue.counts()[LEASED] == len(URLS)
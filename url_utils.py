@@ -0,0 +1,46 @@
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Item ids look like MCO-1553683955 (site prefix, optional dash, number)
+_ITEM_ID_PATTERN = re.compile(r'\b(M[A-Z]{2})-?(\d{6,})')
+
+# Tracking query parameters, dropped from urls without an item id in their path
+_TRACKING_QUERY_PARAMS = frozenset(("id_origin", "tracking_id", "sid", "wid", "is_advertising", "ad_domain", "ad_position", "ad_click_id", "deal_print_id", "polycard_client", "searchVariation"))
+_TRACKING_QUERY_PREFIXES = ("reco_", "c_", "da_", "utm_", "matt_")
+
+
+def extract_item_id(url: str):
+    """
+    Extract the MercadoLibre item id from an url.
+    Args:
+        url: The url of the item page.
+    Returns:
+        The item id normalized as PREFIX-NUMBER (e.g. MCO-1553683955), or None if the url has none.
+    """
+    if not url:
+        return None
+    match = _ITEM_ID_PATTERN.search(url)
+    if match is None:
+        return None
+    return f"{match.group(1)}-{match.group(2)}"
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Strip the fragment and the tracking query parameters of an url, so the same
+    product always maps to the same url. Urls with an item id in their path lose their
+    whole query; the others, like ad click redirects, keep every parameter that is
+    not tracking since it can be what tells them apart.
+    Args:
+        url: The url to canonicalize.
+    Returns:
+        The canonical url.
+    """
+    parts = urlsplit(url.strip())
+    query = ''
+    if _ITEM_ID_PATTERN.search(parts.path) is None:
+        query = urlencode([
+            (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if name not in _TRACKING_QUERY_PARAMS and not name.startswith(_TRACKING_QUERY_PREFIXES)
+        ])
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ''))